@@ -0,0 +1,44 @@
+"""
+JSON helpers shared by the body-parsing middlewares.
+
+Uses orjson when it is installed and falls back to the stdlib otherwise.
+"""
+
+import json
+from typing import Any
+
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def json_loads(data: bytes | str) -> Any:
+    """Parse JSON with orjson when available, falling back to the stdlib."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects some valid JSON (big ints, NaN); let json decide
+            pass
+    return json.loads(data)
+
+
+def json_dumps(data: Any) -> bytes:
+    """
+    Serialize JSON to bytes with orjson when available.
+
+    The stdlib fallback writes compact separators and raw UTF-8, as orjson
+    does, so both backends usually produce the same bytes. Two differences
+    remain: orjson writes NaN and Infinity as null where the stdlib writes
+    the bare tokens, and it drops the exponent's sign padding ("1e16" rather
+    than "1e+16").
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data)
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits, which the stdlib handles
+            pass
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode()
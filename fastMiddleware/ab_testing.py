@@ -5,10 +5,13 @@ Provides A/B test variant assignment and routing.
 """
 
 import hashlib
-import random
+import time
+from bisect import bisect_right
 from collections.abc import Awaitable, Callable
 from contextvars import ContextVar
 from dataclasses import dataclass, field
+from itertools import accumulate
+from random import Random
 
 from starlette.requests import Request
 from starlette.responses import Response
@@ -46,7 +49,48 @@ def get_variant(experiment: str) -> str | None:
     return variants.get(experiment) if variants else None
 
 
-@dataclass
+def _effective_weights(cdf: list[float], count: int) -> list[float]:
+    """
+    Turn raw cumulative weights into the probabilities the CDF scan yields.
+
+    A uniform value in [0, 1) picks the first bound above it, or the last
+    variant when none is, so bounds are clipped to 1 and the remainder goes
+    to the last variant. Variants without a weight are never picked.
+    """
+    weights = [0.0] * count
+    previous = 0.0
+    for index, raw_bound in enumerate(cdf[: count - 1]):
+        bound = min(raw_bound, 1.0)
+        if bound > previous:
+            weights[index] = bound - previous
+            previous = bound
+    weights[-1] = 1.0 - previous
+    return weights
+
+
+def _build_alias_table(weights: list[float]) -> tuple[list[float], list[int]]:
+    """Build a Vose alias table for O(1) weighted sampling."""
+    count = len(weights)
+    total = sum(weights)
+    scaled = [weight * count / total for weight in weights]
+    prob = [1.0] * count
+    alias = list(range(count))
+
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        lo = small.pop()
+        hi = large.pop()
+        prob[lo] = scaled[lo]
+        alias[lo] = hi
+        scaled[hi] += scaled[lo] - 1.0
+        (small if scaled[hi] < 1.0 else large).append(hi)
+
+    # Leftovers are full columns (prob 1.0) up to float rounding
+    return prob, alias
+
+
+@dataclass(slots=True)
 class Experiment:
     """An A/B test experiment."""
 
@@ -54,14 +98,31 @@ class Experiment:
     variants: list[str]
     weights: list[float] | None = None  # Distribution weights
     enabled: bool = True
+    _cdf: list[float] = field(default_factory=list, init=False, repr=False, compare=False)
+    _alias_prob: list[float] = field(default_factory=list, init=False, repr=False, compare=False)
+    _alias_idx: list[int] = field(default_factory=list, init=False, repr=False, compare=False)
+    _salt: bytes = field(default=b"", init=False, repr=False, compare=False)
 
     def __post_init__(self):
+        # Hash prefix for sticky bucketing, encoded once
+        self._salt = f"{self.name}:".encode()
+
         if self.weights is None:
             # Equal distribution
             self.weights = [1.0 / len(self.variants)] * len(self.variants)
 
+        # Raw cumulative weights, so selection is a search not a sum. They are
+        # deliberately not normalized: a hash value past the last bound falls
+        # back to the last variant, which keeps existing sticky buckets stable
+        # when the weights do not sum to 1.
+        self._cdf = list(accumulate(self.weights[: len(self.variants)]))
+        if self.variants:
+            self._alias_prob, self._alias_idx = _build_alias_table(
+                _effective_weights(self._cdf, len(self.variants))
+            )
 
-@dataclass
+
+@dataclass(slots=True)
 class ABTestConfig:
     """
     Configuration for A/B testing middleware.
@@ -69,9 +130,15 @@ class ABTestConfig:
     Attributes:
         experiments: List of experiments.
         cookie_name: Cookie for storing assignments.
-        cookie_max_age: Cookie max age in seconds.
+        cookie_max_age: Cookie max age in seconds. The cookie is re-issued
+            once half of this has passed, so active users keep their variants.
         id_header: Header for user ID (for consistent assignment).
         sticky: Whether assignments are sticky (consistent per user).
+        hash_algorithm: Hash used to bucket sticky users ("md5" or "murmur3").
+            "murmur3" is several times faster but requires the mmh3 package,
+            and switching re-buckets every existing user once.
+        rng: Random source for non-sticky assignment. Pass a seeded
+            random.Random for reproducible assignments in tests.
 
     Example:
         ```python
@@ -98,6 +165,8 @@ class ABTestConfig:
     cookie_max_age: int = 30 * 24 * 60 * 60  # 30 days
     id_header: str = "X-User-ID"
     sticky: bool = True
+    hash_algorithm: str = "md5"
+    rng: Random | None = None
 
 
 class ABTestMiddleware(FastMVCMiddleware):
@@ -136,6 +205,8 @@ class ABTestMiddleware(FastMVCMiddleware):
         ```
     """
 
+    HASH_ALGORITHMS = ("md5", "murmur3")
+
     def __init__(
         self,
         app,
@@ -151,72 +222,165 @@ class ABTestMiddleware(FastMVCMiddleware):
 
         # Build experiment lookup
         self._experiments = {exp.name: exp for exp in self.config.experiments}
+        self._id_header = self.config.id_header
+        self._rand = self.config.rng or Random()
+        # Refreshing at half-life keeps the expiry sliding without a
+        # Set-Cookie on every response
+        self._cookie_refresh_after = self.config.cookie_max_age // 2
+
+        if self.config.hash_algorithm not in self.HASH_ALGORITHMS:
+            raise ValueError(f"Unsupported hash algorithm: {self.config.hash_algorithm}")
+
+        self._murmur = None
+        if self.config.hash_algorithm == "murmur3":
+            try:
+                import mmh3
+            except ImportError as err:
+                raise ImportError(
+                    "mmh3 is required for murmur3 bucketing. Install it with: pip install mmh3"
+                ) from err
+            self._murmur = mmh3.hash
 
     def _get_user_id(self, request: Request) -> str | None:
         """Get user identifier for consistent assignment."""
         # Try header
-        user_id = request.headers.get(self.config.id_header)
+        user_id = request.headers.get(self._id_header)
         if user_id:
             return user_id
 
         # Try request state
         user = getattr(request.state, "user", None)
-        if user:
-            if isinstance(user, dict):
-                return user.get("id")
-            return getattr(user, "id", None)
-
-        return None
-
-    def _assign_variant(self, experiment: Experiment, user_id: str | None) -> str:
-        """Assign a variant for an experiment."""
-        if user_id and self.config.sticky:
+        if user is None:
+            return None
+        if isinstance(user, dict):
+            return user.get("id")
+        return getattr(user, "id", None)
+
+    def _assign_variant(self, experiment: Experiment, user_key: bytes | None) -> str:
+        """
+        Assign a variant for an experiment.
+
+        Args:
+            experiment: The experiment to assign.
+            user_key: UTF-8 encoded user ID for sticky assignment, if any.
+        """
+        if user_key and self.config.sticky:
             # Deterministic assignment based on user ID
-            hash_input = f"{experiment.name}:{user_id}"
-            hash_value = int(hashlib.md5(hash_input.encode()).hexdigest(), 16)
-            value = (hash_value % 10000) / 10000.0
+            hash_input = experiment._salt + user_key
+            if self._murmur is not None:
+                value = (self._murmur(hash_input, signed=False) & 0xFFFF) / 65536.0
+            else:
+                hash_value = int(hashlib.md5(hash_input).hexdigest(), 16)
+                value = (hash_value % 10000) / 10000.0
+        elif experiment._alias_prob:
+            # Random assignment: one alias-table draw, column and coin from one float
+            scaled = self._rand.random() * len(experiment._alias_prob)
+            index = int(scaled)
+            if scaled - index >= experiment._alias_prob[index]:
+                index = experiment._alias_idx[index]
+            return experiment.variants[index]
         else:
-            # Random assignment
-            value = random.random()
-
-        # Select variant based on weights
-        cumulative = 0.0
-        for variant, weight in zip(experiment.variants, experiment.weights, strict=False):
-            cumulative += weight
-            if value < cumulative:
-                return variant
-
-        return experiment.variants[-1]
-
-    def _parse_cookie(self, cookie: str) -> dict[str, str]:
-        """Parse variant assignments from cookie."""
+            return experiment.variants[-1]
+
+        # Select variant based on weights; a linear scan beats bisect for few variants
+        cdf = experiment._cdf
+        if len(cdf) < 8:
+            for index, bound in enumerate(cdf):
+                if value < bound:
+                    return experiment.variants[index]
+            return experiment.variants[-1]
+
+        index = bisect_right(cdf, value)
+        return experiment.variants[min(index, len(experiment.variants) - 1)]
+
+    def _parse_cookie(self, cookie: str) -> tuple[dict[str, str], int, bool]:
+        """
+        Parse variant assignments from cookie.
+
+        Returns:
+            The assignments, the time the cookie was issued (0 when it carries
+            no timestamp) and whether entries for unknown experiments were
+            dropped.
+        """
         assignments = {}
-        for part in cookie.split("|"):
-            if ":" in part:
-                name, variant = part.split(":", 1)
-                assignments[name] = variant
-        return assignments
-
-    def _format_cookie(self, assignments: dict[str, str]) -> str:
-        """Format variant assignments for cookie."""
-        return "|".join(f"{name}:{variant}" for name, variant in assignments.items())
-
-    def _get_assignments(self, request: Request) -> dict[str, str]:
-        """Get all variant assignments for request."""
+        known = self._experiments
+        issued = 0
+        pruned = False
+        pos = 0
+        length = len(cookie)
+
+        # Index walk over "name:variant|name:variant|@issued" without intermediate lists
+        while pos < length:
+            end = cookie.find("|", pos)
+            if end == -1:
+                end = length
+            colon = cookie.find(":", pos, end)
+            if colon != -1:
+                # Drop entries for experiments that are no longer configured
+                name = cookie[pos:colon]
+                if name in known:
+                    assignments[name] = cookie[colon + 1 : end]
+                else:
+                    pruned = True
+            elif cookie.startswith("@", pos, end):
+                try:
+                    issued = int(cookie[pos + 1 : end])
+                except ValueError:
+                    issued = 0
+            pos = end + 1
+
+        return assignments, issued, pruned
+
+    def _format_cookie(self, assignments: dict[str, str], issued: int) -> str:
+        """Format variant assignments and their issue time for cookie."""
+        parts = [f"{name}:{variant}" for name, variant in assignments.items()]
+        parts.append(f"@{issued}")
+        return "|".join(parts)
+
+    def _get_assignments(self, request: Request) -> tuple[dict[str, str], str | None, str]:
+        """
+        Get all variant assignments for request.
+
+        Returns:
+            The assignments, the cookie value to set (None when the client's
+            cookie is current and not yet due for a refresh) and the
+            X-AB-Variants header value.
+        """
         assignments = {}
-        user_id = self._get_user_id(request)
+        changed = False
+        issued = 0
+        user_key = None
+        looked_up = False
+        header_parts = []
 
         # Load existing from cookie
         cookie = request.cookies.get(self.config.cookie_name, "")
         if cookie:
-            assignments = self._parse_cookie(cookie)
+            assignments, issued, changed = self._parse_cookie(cookie)
 
-        # Assign missing experiments
+        # Assign missing experiments, building the header in the same pass
         for name, experiment in self._experiments.items():
-            if experiment.enabled and name not in assignments:
-                assignments[name] = self._assign_variant(experiment, user_id)
+            variant = assignments.get(name)
+            if variant is None:
+                if not experiment.enabled:
+                    continue
+                # Only look up the user once something actually needs assigning
+                if not looked_up and self.config.sticky:
+                    looked_up = True
+                    user_id = self._get_user_id(request)
+                    if user_id:
+                        user_key = str(user_id).encode()
+                variant = self._assign_variant(experiment, user_key)
+                assignments[name] = variant
+                changed = True
+            header_parts.append(f"{name}={variant}")
 
-        return assignments
+        now = int(time.time())
+        if changed or now - issued >= self._cookie_refresh_after:
+            cookie_value = self._format_cookie(assignments, now)
+        else:
+            cookie_value = None
+        return assignments, cookie_value, ",".join(header_parts)
 
     async def dispatch(
         self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
@@ -225,7 +389,7 @@ class ABTestMiddleware(FastMVCMiddleware):
             return await call_next(request)
 
         # Get assignments
-        assignments = self._get_assignments(request)
+        assignments, cookie_value, header_value = self._get_assignments(request)
 
         # Set context
         token = _ab_ctx.set(assignments)
@@ -234,17 +398,19 @@ class ABTestMiddleware(FastMVCMiddleware):
         try:
             response = await call_next(request)
 
-            # Set cookie with assignments
-            response.set_cookie(
-                key=self.config.cookie_name,
-                value=self._format_cookie(assignments),
-                max_age=self.config.cookie_max_age,
-                httponly=True,
-                samesite="lax",
-            )
+            # Only rewrite the cookie when the client's copy is stale
+            if cookie_value is not None:
+                response.set_cookie(
+                    key=self.config.cookie_name,
+                    value=cookie_value,
+                    max_age=self.config.cookie_max_age,
+                    httponly=True,
+                    samesite="lax",
+                )
 
             # Add header showing active variants
-            response.headers["X-AB-Variants"] = ",".join(f"{k}={v}" for k, v in assignments.items())
+            if header_value:
+                response.headers["X-AB-Variants"] = header_value
 
             return response
         finally:
@@ -7,6 +7,7 @@ Parses and handles Accept-Language headers.
 from collections.abc import Awaitable, Callable
 from contextvars import ContextVar
 from dataclasses import dataclass, field
+from functools import lru_cache
 
 from starlette.requests import Request
 from starlette.responses import Response
@@ -22,7 +23,56 @@ def get_language() -> str | None:
     return _language_ctx.get()
 
 
-@dataclass
+# Longer values are parsed without memoizing, so a client cannot park large
+# strings in the cache as keys
+_MAX_CACHED_HEADER = 2048
+
+
+@lru_cache(maxsize=1024)
+def _parse_accept_language_cached(accept_language: str) -> tuple[tuple[str, float], ...]:
+    """
+    Parse an Accept-Language header into (language, quality) pairs.
+
+    Accept-Language values repeat heavily across clients, so results are
+    memoized on the raw header string. The result is a tuple because it
+    is shared between requests.
+    """
+    languages = []
+    needs_sort = False
+    pos = 0
+    length = len(accept_language)
+
+    # Walk comma-separated entries by index rather than split/strip chains
+    while pos < length:
+        end = accept_language.find(",", pos)
+        if end == -1:
+            end = length
+
+        q_pos = accept_language.find(";q=", pos, end)
+        if q_pos == -1:
+            lang = accept_language[pos:end].strip()
+            quality = 1.0
+        else:
+            lang = accept_language[pos:q_pos].strip()
+            try:
+                quality = float(accept_language[q_pos + 3 : end])
+            except ValueError:
+                quality = 1.0
+            if quality != 1.0:
+                needs_sort = True
+
+        # q=0 means "not acceptable" (RFC 9110 12.4.2), so drop the entry
+        if lang and quality > 0:
+            languages.append((lang.lower(), quality))
+        pos = end + 1
+
+    # All-default qualities are already in preference order
+    if needs_sort:
+        languages.sort(key=lambda x: x[1], reverse=True)
+    return tuple(languages)
+
+
+@dataclass(slots=True)
 class AcceptLanguageConfig:
     """
     Configuration for accept language middleware.
@@ -75,46 +125,32 @@ class AcceptLanguageMiddleware(FastMVCMiddleware):
         if supported_languages:
             self.config.supported_languages = supported_languages
 
-    def _parse_header(self, accept_language: str) -> list[tuple[str, float]]:
-        """Parse Accept-Language header."""
-        if not accept_language:
-            return []
-
-        languages = []
-        for raw_part in accept_language.split(","):
-            part = raw_part.strip()
-            if not part:
-                continue
-
-            if ";q=" in part:
-                lang, q = part.split(";q=", 1)
-                try:
-                    quality = float(q)
-                except ValueError:
-                    quality = 1.0
-            else:
-                lang = part
-                quality = 1.0
+        # Lowercased lookup tables: exact tag and primary subtag -> canonical
+        self._exact: dict[str, str] = {}
+        self._prefix: dict[str, str] = {}
+        for supported in self.config.supported_languages:
+            lowered = supported.lower()
+            self._exact.setdefault(lowered, supported)
+            self._prefix.setdefault(lowered.split("-", 1)[0], supported)
 
-            languages.append((lang.strip().lower(), quality))
-
-        return sorted(languages, key=lambda x: x[1], reverse=True)
+    def _parse_header(self, accept_language: str) -> tuple[tuple[str, float], ...]:
+        """Parse Accept-Language header."""
+        if len(accept_language) > _MAX_CACHED_HEADER:
+            return _parse_accept_language_cached.__wrapped__(accept_language)
+        return _parse_accept_language_cached(accept_language)
 
-    def _negotiate(self, requested: list[tuple[str, float]]) -> str:
+    def _negotiate(self, requested: tuple[tuple[str, float], ...]) -> str:
         """Negotiate best language match."""
-        supported_lower = [lang.lower() for lang in self.config.supported_languages]
-
         for lang, _ in requested:
             # Exact match
-            if lang in supported_lower:
-                idx = supported_lower.index(lang)
-                return self.config.supported_languages[idx]
+            match = self._exact.get(lang)
+            if match is not None:
+                return match
 
             # Prefix match (e.g., en-US matches en)
-            lang_prefix = lang.split("-")[0]
-            for i, supported in enumerate(supported_lower):
-                if supported.startswith(lang_prefix) or lang_prefix == supported.split("-")[0]:
-                    return self.config.supported_languages[i]
+            match = self._prefix.get(lang.split("-", 1)[0])
+            if match is not None:
+                return match
 
         return self.config.default_language
 
@@ -125,8 +161,10 @@ class AcceptLanguageMiddleware(FastMVCMiddleware):
             return await call_next(request)
 
         accept_language = request.headers.get("Accept-Language", "")
-        requested = self._parse_header(accept_language)
-        language = self._negotiate(requested)
+        if not accept_language or accept_language == "*":
+            language = self.config.default_language
+        else:
+            language = self._negotiate(self._parse_header(accept_language))
 
         token = _language_ctx.set(language)
         request.state.language = language
@@ -90,6 +90,24 @@ class FastMVCMiddleware(BaseHTTPMiddleware, ABC):
         # Fall back to direct client connection
         return request.client.host if request.client else "unknown"
 
+    def set_raw_headers(self, response: Response, headers: list[tuple[bytes, bytes]]) -> None:
+        """
+        Set several response headers in one pass over the raw header list.
+
+        Existing entries with the same names are replaced, as with
+        ``response.headers[name] = value``, but the raw list is filtered and
+        extended once instead of being scanned for every header.
+
+        Args:
+            response: The response to modify.
+            headers: (lowercase name, value) pairs, already latin-1 encoded.
+        """
+        raw = response.raw_headers
+        names = {name for name, _ in headers}
+        if any(key in names for key, _ in raw):
+            raw[:] = [(key, value) for key, value in raw if key not in names]
+        raw.extend(headers)
+
     @abstractmethod
     async def dispatch(
         self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
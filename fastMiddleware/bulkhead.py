@@ -14,7 +14,7 @@ from starlette.responses import JSONResponse, Response
 from fastmiddleware.base import FastMVCMiddleware
 
 
-@dataclass
+@dataclass(slots=True)
 class BulkheadConfig:
     """
     Configuration for bulkhead middleware.
@@ -74,20 +74,25 @@ class BulkheadMiddleware(FastMVCMiddleware):
         if max_concurrent:
             self.config.max_concurrent = max_concurrent
 
+        self._max_waiting = self.config.max_waiting
+        self._timeout = self.config.timeout
         self._semaphore = asyncio.Semaphore(self.config.max_concurrent)
         self._waiting = 0
         self._path_semaphores: dict[str, asyncio.Semaphore] = {}
 
+        if self.config.per_path:
+            # Configured paths get their semaphore up front
+            self._path_semaphores = {
+                path: asyncio.Semaphore(limit) for path, limit in self.config.path_limits.items()
+            }
+
     def _get_semaphore(self, path: str) -> asyncio.Semaphore:
         """Get semaphore for path."""
-        if not self.config.per_path:
-            return self._semaphore
-
-        if path not in self._path_semaphores:
-            limit = self.config.path_limits.get(path, self.config.max_concurrent)
-            self._path_semaphores[path] = asyncio.Semaphore(limit)
-
-        return self._path_semaphores[path]
+        semaphore = self._path_semaphores.get(path)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.config.max_concurrent)
+            self._path_semaphores[path] = semaphore
+        return semaphore
 
     async def dispatch(
         self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
@@ -95,36 +100,44 @@ class BulkheadMiddleware(FastMVCMiddleware):
         if self.should_skip(request):
             return await call_next(request)
 
-        semaphore = self._get_semaphore(request.url.path)
-
-        # Check waiting queue
-        if self._waiting >= self.config.max_waiting:
-            return JSONResponse(
-                status_code=503,
-                content={
-                    "error": True,
-                    "message": "Service overloaded",
-                    "retry_after": 5,
-                },
-                headers={"Retry-After": "5"},
-            )
-
-        self._waiting += 1
-        try:
-            await asyncio.wait_for(
-                semaphore.acquire(),
-                timeout=self.config.timeout,
-            )
-        except asyncio.TimeoutError:
-            return JSONResponse(
-                status_code=503,
-                content={
-                    "error": True,
-                    "message": "Request timeout waiting for resources",
-                },
-            )
-        finally:
-            self._waiting -= 1
+        if self.config.per_path:
+            semaphore = self._get_semaphore(request.url.path)
+        else:
+            semaphore = self._semaphore
+
+        if not semaphore.locked():
+            # Uncontended: acquire() returns without suspending, so skip the
+            # future and timer handle that wait_for would create
+            await semaphore.acquire()
+        else:
+            # Check waiting queue
+            if self._waiting >= self._max_waiting:
+                return JSONResponse(
+                    status_code=503,
+                    content={
+                        "error": True,
+                        "message": "Service overloaded",
+                        "retry_after": 5,
+                    },
+                    headers={"Retry-After": "5"},
+                )
+
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(
+                    semaphore.acquire(),
+                    timeout=self._timeout,
+                )
+            except asyncio.TimeoutError:
+                return JSONResponse(
+                    status_code=503,
+                    content={
+                        "error": True,
+                        "message": "Request timeout waiting for resources",
+                    },
+                )
+            finally:
+                self._waiting -= 1
 
         try:
             return await call_next(request)
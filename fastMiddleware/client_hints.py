@@ -4,7 +4,6 @@ Client Hints Middleware for FastMVC.
 Requests and processes Client Hints for adaptive responses.
 """
 
-import contextlib
 from collections.abc import Awaitable, Callable
 from contextvars import ContextVar
 from dataclasses import dataclass, field
@@ -24,7 +23,7 @@ def get_client_hints() -> dict[str, Any]:
     return _hints_ctx.get() or {}
 
 
-@dataclass
+@dataclass(slots=True)
 class ClientHintsConfig:
     """
     Configuration for client hints middleware.
@@ -75,6 +74,13 @@ class ClientHintsMiddleware(FastMVCMiddleware):
         ```
     """
 
+    # (header, hint key) pairs for hints parsed as floats
+    NUMERIC_HINTS = (
+        ("DPR", "dpr"),
+        ("Viewport-Width", "viewport_width"),
+        ("Device-Memory", "device_memory"),
+    )
+
     def __init__(
         self,
         app,
@@ -88,41 +94,52 @@ class ClientHintsMiddleware(FastMVCMiddleware):
         if request_hints:
             self.config.request_hints = request_hints
 
+        # Response headers are static, so build them once
+        self._hint_headers: dict[str, str] = {}
+        if self.config.request_hints:
+            self._hint_headers["Accept-CH"] = ", ".join(self.config.request_hints)
+        if self.config.critical_hints:
+            self._hint_headers["Critical-CH"] = ", ".join(self.config.critical_hints)
+
     def _parse_hints(self, request: Request) -> dict[str, Any]:
         """Parse client hints from headers."""
         hints: dict[str, Any] = {}
+        headers = request.headers
 
         # Parse numeric hints
-        for header in ["DPR", "Viewport-Width", "Device-Memory"]:
-            value = request.headers.get(header)
+        for header, key in self.NUMERIC_HINTS:
+            value = headers.get(header)
             if value:
-                with contextlib.suppress(ValueError):
-                    hints[header.lower().replace("-", "_")] = float(value)
+                # Plain try/except avoids building a suppress() object per hint
+                try:
+                    hints[key] = float(value)
+                except ValueError:
+                    continue
 
         # Parse boolean hints
-        save_data = request.headers.get("Save-Data")
+        save_data = headers.get("Save-Data")
         if save_data:
             hints["save_data"] = save_data.lower() == "on"
 
         # Parse UA hints
-        ua = request.headers.get("Sec-CH-UA")
+        ua = headers.get("Sec-CH-UA")
         if ua:
             hints["user_agent"] = ua
 
-        ua_mobile = request.headers.get("Sec-CH-UA-Mobile")
+        ua_mobile = headers.get("Sec-CH-UA-Mobile")
         if ua_mobile:
             hints["is_mobile"] = ua_mobile == "?1"
 
-        ua_platform = request.headers.get("Sec-CH-UA-Platform")
+        ua_platform = headers.get("Sec-CH-UA-Platform")
         if ua_platform:
             hints["platform"] = ua_platform.strip('"')
 
         # Parse preference hints
-        color_scheme = request.headers.get("Sec-CH-Prefers-Color-Scheme")
+        color_scheme = headers.get("Sec-CH-Prefers-Color-Scheme")
         if color_scheme:
             hints["color_scheme"] = color_scheme.strip('"')
 
-        reduced_motion = request.headers.get("Sec-CH-Prefers-Reduced-Motion")
+        reduced_motion = headers.get("Sec-CH-Prefers-Reduced-Motion")
         if reduced_motion:
             hints["reduced_motion"] = reduced_motion == "reduce"
 
@@ -142,11 +159,8 @@ class ClientHintsMiddleware(FastMVCMiddleware):
             response = await call_next(request)
 
             # Request hints for future requests
-            if self.config.request_hints:
-                response.headers["Accept-CH"] = ", ".join(self.config.request_hints)
-
-            if self.config.critical_hints:
-                response.headers["Critical-CH"] = ", ".join(self.config.critical_hints)
+            if self._hint_headers:
+                response.headers.update(self._hint_headers)
 
             return response
         finally:
@@ -7,6 +7,7 @@ Handles Accept header parsing and content type negotiation.
 from collections.abc import Awaitable, Callable
 from contextvars import ContextVar
 from dataclasses import dataclass, field
+from functools import lru_cache
 
 from starlette.requests import Request
 from starlette.responses import JSONResponse, Response
@@ -22,7 +23,54 @@ def get_negotiated_type() -> str | None:
     return _content_type_ctx.get()
 
 
-@dataclass
+# Longer values are parsed without memoizing, so a client cannot park large
+# strings in the cache as keys
+_MAX_CACHED_HEADER = 2048
+
+
+@lru_cache(maxsize=1024)
+def _parse_accept_cached(accept: str) -> tuple[tuple[str, float], ...]:
+    """
+    Parse an Accept header into (type, quality) pairs.
+
+    Memoized on the raw header string; the result is a tuple because it
+    is shared between requests.
+    """
+    types = []
+    needs_sort = False
+    pos = 0
+    length = len(accept)
+
+    # Walk comma-separated entries by index rather than split/strip chains
+    while pos < length:
+        end = accept.find(",", pos)
+        if end == -1:
+            end = length
+
+        q_pos = accept.find(";q=", pos, end)
+        if q_pos == -1:
+            mime = accept[pos:end].strip()
+            quality = 1.0
+        else:
+            mime = accept[pos:q_pos].strip()
+            try:
+                quality = float(accept[q_pos + 3 : end])
+            except ValueError:
+                quality = 1.0
+            if quality != 1.0:
+                needs_sort = True
+
+        if mime:
+            types.append((mime, quality))
+        pos = end + 1
+
+    # All-default qualities are already in preference order
+    if needs_sort:
+        types.sort(key=lambda x: x[1], reverse=True)
+    return tuple(types)
+
+
+@dataclass(slots=True)
 class ContentNegotiationConfig:
     """
     Configuration for content negotiation middleware.
@@ -83,57 +131,44 @@ class ContentNegotiationMiddleware(FastMVCMiddleware):
         if supported_types:
             self.config.supported_types = supported_types
 
-    def _parse_accept(self, accept: str) -> list[tuple[str, float]]:
-        """Parse Accept header into list of (type, quality) tuples."""
-        if not accept:
-            return []
-
-        types = []
-        for raw_part in accept.split(","):
-            part = raw_part.strip()
-            if not part:
-                continue
-
-            if ";q=" in part:
-                mime, q = part.split(";q=")
-                try:
-                    quality = float(q.strip())
-                except ValueError:
-                    quality = 1.0
-            else:
-                mime = part
-                quality = 1.0
-
-            types.append((mime.strip(), quality))
-
-        return sorted(types, key=lambda x: x[1], reverse=True)
-
-    def _matches(self, requested: str, supported: str) -> bool:
-        """Check if requested type matches supported type."""
-        if requested == "*/*":
-            return True
+        # Match tables: exact types and the first supported type per major type
+        self._supported_set = frozenset(self.config.supported_types)
+        self._by_major: dict[str, str] = {}
+        for supported in self.config.supported_types:
+            major, sep, _ = supported.partition("/")
+            if sep:
+                self._by_major.setdefault(major, supported)
 
-        if requested == supported:
-            return True
-
-        # Handle wildcards like text/*
-        if requested.endswith("/*"):
-            prefix = requested[:-1]
-            return supported.startswith(prefix)
-
-        return False
+    def _parse_accept(self, accept: str) -> tuple[tuple[str, float], ...]:
+        """Parse Accept header into (type, quality) tuples."""
+        if len(accept) > _MAX_CACHED_HEADER:
+            return _parse_accept_cached.__wrapped__(accept)
+        return _parse_accept_cached(accept)
 
     def _negotiate(self, accept: str) -> str | None:
         """Negotiate best content type."""
+        # Bare wildcard (curl, most API clients) accepts our first choice
+        if accept == "*/*":
+            return self.config.supported_types[0] if self.config.supported_types else None
+        if not accept:
+            return self.config.default_type
+
         requested_types = self._parse_accept(accept)
 
         if not requested_types:
             return self.config.default_type
 
         for requested, _ in requested_types:
-            for supported in self.config.supported_types:
-                if self._matches(requested, supported):
-                    return supported
+            if requested == "*/*":
+                return self.config.supported_types[0] if self.config.supported_types else None
+
+            # Handle wildcards like text/*
+            if requested.endswith("/*"):
+                match = self._by_major.get(requested[:-2])
+                if match is not None:
+                    return match
+            elif requested in self._supported_set:
+                return requested
 
         return None
 
@@ -38,7 +38,7 @@ def get_context_value(key: str, default: Any = None) -> Any:
     return get_context().get(key, default)
 
 
-@dataclass
+@dataclass(slots=True)
 class ContextConfig:
     """
     Configuration for context middleware.
@@ -90,21 +90,28 @@ class ContextMiddleware(FastMVCMiddleware):
         if extract_headers:
             self.config.extract_headers = extract_headers
 
+        # Extraction rules are static; freeze them for iteration
+        self._extract_headers = tuple(self.config.extract_headers.items())
+        self._extract_query = tuple(self.config.extract_query.items())
+
     def _extract_context(self, request: Request) -> dict[str, Any]:
         """Extract context from request."""
         ctx: dict[str, Any] = {}
 
         # Extract from headers
-        for header, key in self.config.extract_headers.items():
-            value = request.headers.get(header)
+        headers = request.headers
+        for header, key in self._extract_headers:
+            value = headers.get(header)
             if value:
                 ctx[key] = value
 
-        # Extract from query
-        for param, key in self.config.extract_query.items():
-            value = request.query_params.get(param)
-            if value:
-                ctx[key] = value
+        # Extract from query (skips building query_params when unused)
+        if self._extract_query:
+            query_params = request.query_params
+            for param, key in self._extract_query:
+                value = query_params.get(param)
+                if value:
+                    ctx[key] = value
 
         # Add request info
         ctx["path"] = request.url.path
@@ -6,6 +6,8 @@ Handles Content-Security-Policy violation reports.
 
 import json
 import logging
+import sys
+from collections import deque
 from collections.abc import Awaitable, Callable
 from dataclasses import dataclass
 from typing import Any
@@ -13,6 +15,7 @@ from typing import Any
 from starlette.requests import Request
 from starlette.responses import JSONResponse, Response
 
+from fastmiddleware._json import json_loads
 from fastmiddleware.base import FastMVCMiddleware
 
 
@@ -70,9 +73,12 @@ class CSPReportMiddleware(FastMVCMiddleware):
 
         if report_uri:
             self.config.report_uri = report_uri
+        # Interned so the per-request path compare can short-circuit on identity
+        self.config.report_uri = sys.intern(self.config.report_uri)
 
         self._logger = logging.getLogger(self.config.logger_name)
-        self._reports: list[dict[str, Any]] = []
+        # Oldest reports fall off the front once max_stored is reached
+        self._reports: deque[dict[str, Any]] = deque(maxlen=self.config.max_stored)
 
     def get_reports(self) -> list[dict[str, Any]]:
         """Get stored CSP violation reports."""
@@ -86,16 +92,17 @@ class CSPReportMiddleware(FastMVCMiddleware):
         """Handle incoming CSP report."""
         try:
             body = await request.body()
-            report = json.loads(body)
+            report = json_loads(body)
 
             # Handle both wrapped and unwrapped format
             violation = report.get("csp-report", report)
 
-            if self.config.log_reports:
+            if self.config.log_reports and self._logger.isEnabledFor(logging.WARNING):
                 self._logger.warning(
-                    f"CSP Violation: {violation.get('violated-directive')} "
-                    f"blocked {violation.get('blocked-uri')} "
-                    f"on {violation.get('document-uri')}"
+                    "CSP Violation: %s blocked %s on %s",
+                    violation.get("violated-directive"),
+                    violation.get("blocked-uri"),
+                    violation.get("document-uri"),
                 )
 
             if self.config.store_reports:
@@ -107,9 +114,6 @@ class CSPReportMiddleware(FastMVCMiddleware):
                     }
                 )
 
-                if len(self._reports) > self.config.max_stored:
-                    self._reports = self._reports[-self.config.max_stored :]
-
             return Response(status_code=204)
 
         except json.JSONDecodeError:
@@ -122,7 +126,7 @@ class CSPReportMiddleware(FastMVCMiddleware):
         self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
     ) -> Response:
         # Handle CSP report endpoint
-        if request.url.path == self.config.report_uri and request.method == "POST":
+        if request.scope["path"] == self.config.report_uri and request.method == "POST":
             return await self._handle_report(request)
 
         if self.should_skip(request):
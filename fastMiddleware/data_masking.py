@@ -4,18 +4,34 @@ Data Masking Middleware for FastMVC.
 Masks sensitive data in responses for security and privacy.
 """
 
+import asyncio
 import json
 import re
-from collections.abc import Awaitable, Callable
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
 from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Any
 
+from starlette.datastructures import MutableHeaders
 from starlette.requests import Request
-from starlette.responses import Response
+from starlette.responses import Response, StreamingResponse
 
+from fastmiddleware._json import json_dumps, json_loads
 from fastmiddleware.base import FastMVCMiddleware
 
 
+try:
+    import re2
+except ImportError:  # pragma: no cover - optional speedup
+    re2 = None
+
+
+@lru_cache(maxsize=256)
+def _mask_run(char: str, length: int) -> str:
+    """Return a cached run of mask characters."""
+    return char * length
+
+
 @dataclass
 class MaskingRule:
     """A rule for masking sensitive data."""
@@ -35,13 +51,14 @@ class MaskingRule:
         visible_length = self.show_first + self.show_last
 
         if length <= visible_length:
-            return self.mask_char * length
+            return _mask_run(self.mask_char, length)
 
-        prefix = value[: self.show_first] if self.show_first > 0 else ""
+        masked = _mask_run(self.mask_char, length - visible_length)
         suffix = value[-self.show_last :] if self.show_last > 0 else ""
-        masked_length = length - visible_length
+        if self.show_first == 0:
+            return masked + suffix
 
-        return f"{prefix}{self.mask_char * masked_length}{suffix}"
+        return f"{value[: self.show_first]}{masked}{suffix}"
 
 
 @dataclass
@@ -55,6 +72,12 @@ class DataMaskingConfig:
         patterns: Regex patterns to detect and mask.
         custom_rules: Custom masking rules.
         mask_in_logs: Also mask in logs.
+        stream: Mask JSON incrementally as it is sent instead of buffering
+            the whole body (requires ijson). Peak memory stays bounded by the
+            nesting depth, but malformed bodies are cut off at the error.
+        thread_threshold: Bodies larger than this many bytes are masked in a
+            worker thread so the event loop keeps serving other requests.
+            None masks every body inline.
 
     Example:
         ```python
@@ -97,6 +120,8 @@ class DataMaskingConfig:
     custom_rules: list[MaskingRule] = field(default_factory=list)
     default_mask_char: str = "*"
     default_show_last: int = 4
+    stream: bool = False
+    thread_threshold: int | None = 64 * 1024
 
 
 class DataMaskingMiddleware(FastMVCMiddleware):
@@ -147,29 +172,100 @@ class DataMaskingMiddleware(FastMVCMiddleware):
         if fields is not None:
             self.config.fields = fields
 
+        self._ijson = None
+        if self.config.stream:
+            try:
+                import ijson
+            except ImportError as err:
+                raise ImportError(
+                    "ijson is required for streaming masking. Install it with: pip install ijson"
+                ) from err
+            self._ijson = ijson
+
+        # Mask runs for the common short lengths, indexed by length
+        self._mask_runs = tuple(self.config.default_mask_char * i for i in range(65))
+
         # Compile patterns
         self._compiled_patterns = {
             name: re.compile(pattern) for name, pattern in self.config.patterns.items()
         }
 
+        # Field names never change after init, so lowercase them once
+        self._fields_lower = frozenset(name.lower() for name in self.config.fields)
+        self._rules_lower = tuple((rule.field.lower(), rule) for rule in self.config.custom_rules)
+
+        # One alternation per lookup, so each key is scanned once in C rather
+        # than once per configured field
+        self._field_matcher = self._build_key_matcher(self._fields_lower)
+        self._rule_matcher = self._build_key_matcher(name for name, _ in self._rules_lower)
+
+        # Patterns are applied one after another, each to the output of the
+        # previous one, so text claimed by one pattern is still seen by the
+        # next (the digits of an SMS gateway address are masked as an SSN, then
+        # the rest as an email). One alternation would hand each span to a
+        # single alternative, so it is only used to skip strings nothing
+        # matches. RE2 does both in linear time; without it the stdlib scans,
+        # except when capturing groups would renumber and break backreferences.
+        self._sub_patterns: tuple[Any, ...] = tuple(self._compiled_patterns.values())
+        self._combined_pattern: Any = None
+        if self.config.patterns:
+            combined = "|".join(f"(?:{pattern})" for pattern in self.config.patterns.values())
+            if re2 is not None:
+                try:
+                    re2_patterns = tuple(re2.compile(p) for p in self.config.patterns.values())
+                    self._combined_pattern = re2.compile(combined)
+                    self._sub_patterns = re2_patterns
+                except re2.error:
+                    # Pattern uses syntax RE2 lacks (lookarounds, backrefs)
+                    self._combined_pattern = None
+            if self._combined_pattern is None and not any(
+                pattern.groups for pattern in self._compiled_patterns.values()
+            ):
+                try:
+                    self._combined_pattern = re.compile(combined)
+                except re.error:
+                    # e.g. inline global flags that are only valid at the start
+                    self._combined_pattern = None
+
+    @staticmethod
+    def _build_key_matcher(names: Iterable[str]) -> re.Pattern[str] | None:
+        """Compile a substring matcher for lowercased key names."""
+        escaped = [re.escape(name) for name in names]
+        return re.compile("|".join(escaped)) if escaped else None
+
     def _should_mask_field(self, key: str) -> bool:
         """Check if field should be masked."""
+        if self._field_matcher is None:
+            return False
+
         key_lower = key.lower()
-        return any(field.lower() in key_lower for field in self.config.fields)
+        if key_lower in self._fields_lower:
+            return True
+        return self._field_matcher.search(key_lower) is not None
 
     def _mask_string(self, value: str, show_last: int = 4) -> str:
         """Mask a string value."""
-        if len(value) <= show_last:
-            return self.config.default_mask_char * len(value)
+        length = len(value)
+        runs = self._mask_runs
+        if length <= show_last:
+            return runs[length] if length < len(runs) else runs[1] * length
 
-        masked_length = len(value) - show_last
-        return self.config.default_mask_char * masked_length + value[-show_last:]
+        masked_length = length - show_last
+        run = runs[masked_length] if masked_length < len(runs) else runs[1] * masked_length
+        return run + value[-show_last:]
 
     def _get_custom_rule(self, key: str) -> MaskingRule | None:
         """Get custom masking rule for key."""
+        if self._rule_matcher is None:
+            return None
+
         key_lower = key.lower()
-        for rule in self.config.custom_rules:
-            if rule.field.lower() in key_lower:
+        if self._rule_matcher.search(key_lower) is None:
+            return None
+
+        # Some rule matches; keep list order deciding which one applies
+        for field_lower, rule in self._rules_lower:
+            if field_lower in key_lower:
                 return rule
         return None
 
@@ -194,24 +290,185 @@ class DataMaskingMiddleware(FastMVCMiddleware):
 
     def _mask_patterns_in_string(self, text: str) -> str:
         """Mask pattern matches in a string."""
-        for pattern in self._compiled_patterns.values():
-            text = pattern.sub(
-                lambda m: self._mask_string(m.group(), self.config.default_show_last),
-                text,
-            )
+        combined = self._combined_pattern
+        if combined is not None and combined.search(text) is None:
+            return text
+
+        show_last = self.config.default_show_last
+        for pattern in self._sub_patterns:
+            masked, count = pattern.subn(lambda m: self._mask_string(m.group(), show_last), text)
+            if count:
+                text = masked
         return text
 
     def _mask_data(self, data: Any) -> Any:
-        """Recursively mask sensitive data."""
-        if isinstance(data, dict):
-            return {
-                key: self._mask_data(self._mask_value(key, value)) for key, value in data.items()
-            }
-        elif isinstance(data, list):
-            return [self._mask_data(item) for item in data]
-        elif isinstance(data, str):
-            return self._mask_patterns_in_string(data)
-        return data
+        """Mask sensitive data in a decoded JSON document."""
+        return self._mask_data_tracked(data)[0]
+
+    def _mask_data_tracked(self, data: Any) -> tuple[Any, bool]:
+        """
+        Mask sensitive data, reporting whether anything changed.
+
+        Walks the document with an explicit stack rather than recursion, so
+        deeply nested bodies cost no call frames and cannot hit the recursion
+        limit. Unchanged containers are returned as-is rather than rebuilt,
+        which lets the caller reuse the original body bytes.
+        """
+        mask_string = self._mask_patterns_in_string
+
+        if isinstance(data, str):
+            masked = mask_string(data)
+            return masked, masked is not data
+        if not isinstance(data, (dict, list)):
+            return data, False
+
+        mask_value = self._mask_value
+
+        def open_frame(source: Any, key: Any) -> list[Any]:
+            # Frame layout: source, result, entry iterator, changed, key in parent
+            if isinstance(source, dict):
+                return [source, {}, iter(source.items()), False, key]
+            return [source, [], iter(source), False, key]
+
+        stack = [open_frame(data, None)]
+        while True:
+            frame = stack[-1]
+            result = frame[1]
+            is_dict = isinstance(result, dict)
+            changed = frame[3]
+
+            for entry in frame[2]:
+                if is_dict:
+                    key, original = entry
+                    value = mask_value(key, original)
+                    changed = changed or value is not original
+                else:
+                    key = None
+                    value = entry
+
+                if isinstance(value, (dict, list)):
+                    # Descend; this frame resumes from its iterator later
+                    frame[3] = changed
+                    stack.append(open_frame(value, key))
+                    break
+
+                if isinstance(value, str):
+                    masked = mask_string(value)
+                    changed = changed or masked is not value
+                    value = masked
+
+                if is_dict:
+                    result[key] = value
+                else:
+                    result.append(value)
+            else:
+                # Every entry done: close the frame and hand it to its parent
+                stack.pop()
+                done = result if changed else frame[0]
+                if not stack:
+                    return done, changed
+
+                parent = stack[-1]
+                parent[3] = parent[3] or changed
+                if isinstance(parent[1], dict):
+                    parent[1][frame[4]] = done
+                else:
+                    parent[1].append(done)
+
+    def _encode_events(self, events: list[tuple[str, str, Any]], stack: list[list[Any]]) -> str:
+        """
+        Re-encode ijson parser events as JSON text, masking scalars.
+
+        Each stack frame is [is_map, needs_comma, current_key] for an open
+        container, so encoding can resume across body chunks.
+        """
+        parts = []
+        for _, event, value in events:
+            if event == "map_key":
+                frame = stack[-1]
+                if frame[1]:
+                    parts.append(",")
+                frame[1] = True
+                frame[2] = value
+                parts.append(json.dumps(value, ensure_ascii=False))
+                parts.append(":")
+                continue
+
+            if event in {"end_map", "end_array"}:
+                stack.pop()
+                parts.append("}" if event == "end_map" else "]")
+                continue
+
+            parent = stack[-1] if stack else None
+            if parent is not None and not parent[0]:
+                if parent[1]:
+                    parts.append(",")
+                parent[1] = True
+
+            if event == "start_map":
+                stack.append([True, False, None])
+                parts.append("{")
+            elif event == "start_array":
+                stack.append([False, False, None])
+                parts.append("[")
+            else:
+                # Same order as _mask_data: key rules first, then patterns
+                in_map = parent is not None and parent[0]
+                masked = self._mask_value(parent[2], value) if in_map else value
+                if isinstance(masked, str):
+                    masked = self._mask_patterns_in_string(masked)
+                parts.append(json.dumps(masked, ensure_ascii=False))
+
+        del events[:]
+        return "".join(parts)
+
+    async def _mask_stream(self, body_iterator: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Mask a JSON body chunk by chunk."""
+        ijson = self._ijson
+        events = ijson.sendable_list()
+        parser = ijson.parse_coro(events, use_float=True)
+        stack: list[list[Any]] = []
+
+        try:
+            async for chunk in body_iterator:
+                parser.send(chunk)
+                text = self._encode_events(events, stack)
+                if text:
+                    yield text.encode()
+
+            parser.close()
+            text = self._encode_events(events, stack)
+            if text:
+                yield text.encode()
+        except ijson.JSONError:
+            # Not valid JSON; stop rather than emit a half-rewritten body
+            return
+
+    def _mask_body_sync(self, body: bytes) -> bytes:
+        """Mask a buffered JSON body, returning it unchanged if nothing applies."""
+        try:
+            data = json_loads(body)
+            masked_data, changed = self._mask_data_tracked(data)
+        except (json.JSONDecodeError, ValueError):
+            return body
+
+        # Nothing sensitive found: send the original bytes, skip encoding
+        if not changed:
+            return body
+
+        return json_dumps(masked_data)
+
+    def _with_body(self, response: Response, body: bytes) -> Response:
+        """
+        Build a response carrying the original status and headers with a new body.
+
+        The raw header list is copied as-is, so repeated headers such as
+        Set-Cookie survive, and only Content-Length is rewritten.
+        """
+        rebuilt = Response(content=body, status_code=response.status_code)
+        rebuilt.raw_headers = list(response.raw_headers)
+        MutableHeaders(raw=rebuilt.raw_headers)["content-length"] = str(len(body))
+        return rebuilt
 
     async def dispatch(
         self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
@@ -222,30 +479,35 @@ class DataMaskingMiddleware(FastMVCMiddleware):
         response = await call_next(request)
 
         # Only process JSON responses
-        content_type = response.headers.get("Content-Type", "")
-        if "application/json" not in content_type:
+        headers = response.headers
+        media_type = getattr(response, "media_type", None)
+        content_type = headers.get("content-type", "")
+        if media_type != "application/json" and not content_type.startswith("application/json"):
             return response
 
-        # Read body
-        body = b""
-        async for chunk in response.body_iterator:
-            body += chunk
-
-        # Parse and mask
-        try:
-            data = json.loads(body)
-            masked_data = self._mask_data(data)
-            masked_body = json.dumps(masked_data)
+        # Nothing to mask, and no body iterator worth draining
+        if response.status_code in {204, 304} or headers.get("content-length") == "0":
+            return response
 
-            return Response(
-                content=masked_body,
-                status_code=response.status_code,
-                headers=dict(response.headers),
-                media_type="application/json",
-            )
-        except (json.JSONDecodeError, ValueError):
-            return Response(
-                content=body,
+        if self._ijson is not None:
+            masked = StreamingResponse(
+                self._mask_stream(response.body_iterator),
                 status_code=response.status_code,
-                headers=dict(response.headers),
             )
+            # Masking can change the length, so drop the original Content-Length
+            masked.raw_headers = [
+                (key, value) for key, value in response.raw_headers if key != b"content-length"
+            ]
+            return masked
+
+        # Read body
+        body = b"".join([chunk async for chunk in response.body_iterator])
+
+        # Parse and mask; large bodies go to a thread to keep the loop free
+        threshold = self.config.thread_threshold
+        if threshold is not None and len(body) > threshold:
+            masked_body = await asyncio.to_thread(self._mask_body_sync, body)
+        else:
+            masked_body = self._mask_body_sync(body)
+
+        return self._with_body(response, masked_body)
@@ -17,6 +17,9 @@ from fastmiddleware.base import FastMVCMiddleware
 # Context variable for feature flags
 _flags_ctx: ContextVar[dict[str, bool] | None] = ContextVar("feature_flags", default=None)
 
+# Header override values that switch a flag on
+_TRUTHY = frozenset({"true", "1", "yes", "on"})
+
 
 def get_feature_flags() -> dict[str, bool]:
     """
@@ -149,22 +152,29 @@ class FeatureFlagMiddleware(FastMVCMiddleware):
         if flags is not None:
             self.config.flags = flags
 
+        # Without a provider or overrides every request starts from the same
+        # flags, so the enabled-flags header value can be built once
+        self._static_only = not self.config.flag_provider and not self.config.header_overrides
+        self._static_flags = dict(self.config.flags)
+        self._static_enabled = ",".join(k for k, v in self._static_flags.items() if v)
+
     def _parse_header_overrides(self, header: str) -> dict[str, bool]:
         """Parse feature flag header overrides."""
         overrides = {}
 
-        for raw_pair in header.split(","):
-            pair = raw_pair.strip()
-            if "=" in pair:
-                key, value = pair.split("=", 1)
-                key = key.strip()
-                value = value.strip().lower()
-                overrides[key] = value in ("true", "1", "yes", "on")
+        for pair in header.split(","):
+            key, sep, value = pair.partition("=")
+            if sep:
+                overrides[key.strip()] = value.strip().lower() in _TRUTHY
 
         return overrides
 
     def _get_flags(self, request: Request) -> dict[str, bool]:
         """Get all feature flags for request."""
+        if self._static_only:
+            # Per-request copy: handlers may change their flags, not everyone's
+            return dict(self._static_flags)
+
         # Start with static flags
         flags = dict(self.config.flags)
 
@@ -211,9 +221,12 @@ class FeatureFlagMiddleware(FastMVCMiddleware):
             response = await call_next(request)
 
             # Optionally expose enabled flags in header
-            enabled = [k for k, v in flags.items() if v]
+            if self._static_only and flags == self._static_flags:
+                enabled = self._static_enabled
+            else:
+                enabled = ",".join(k for k, v in flags.items() if v)
             if enabled:
-                response.headers["X-Features-Enabled"] = ",".join(enabled)
+                response.headers["X-Features-Enabled"] = enabled
 
             return response
         finally:
@@ -6,6 +6,7 @@ Handles graceful shutdown with in-flight request draining.
 
 import asyncio
 import contextlib
+import sys
 from collections.abc import Awaitable, Callable
 from dataclasses import dataclass
 
@@ -60,10 +61,11 @@ class GracefulShutdownMiddleware(FastMVCMiddleware):
 
         if timeout:
             self.config.timeout = timeout
+        # str == checks identity first, so an interned path often skips the compare
+        self.config.check_path = sys.intern(self.config.check_path)
 
         self._shutting_down = False
         self._in_flight = 0
-        self._lock = asyncio.Lock()
         self._drain_event = asyncio.Event()
 
     @property
@@ -94,14 +96,16 @@ class GracefulShutdownMiddleware(FastMVCMiddleware):
 
     async def _wait_for_drain(self) -> None:
         """Wait for all in-flight requests to complete."""
-        while self._in_flight > 0:
-            await asyncio.sleep(0.1)
+        if self._in_flight == 0:
+            return
+        # Set by dispatch when the last in-flight request finishes
+        await self._drain_event.wait()
 
     async def dispatch(
         self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
     ) -> Response:
         # Handle status check
-        if request.url.path == self.config.check_path:
+        if request.scope["path"] == self.config.check_path:
             return JSONResponse(
                 {
                     "shutting_down": self._shutting_down,
@@ -120,12 +124,13 @@ class GracefulShutdownMiddleware(FastMVCMiddleware):
                 headers={"Connection": "close"},
             )
 
-        # Track in-flight requests
-        async with self._lock:
-            self._in_flight += 1
+        # Track in-flight requests; dispatch runs on a single event loop
+        # thread, so the counter needs no lock
+        self._in_flight += 1
 
         try:
             return await call_next(request)
         finally:
-            async with self._lock:
-                self._in_flight -= 1
+            self._in_flight -= 1
+            if self._shutting_down and self._in_flight == 0:
+                self._drain_event.set()
@@ -7,11 +7,13 @@ Validates request bodies against JSON schemas.
 import json
 from collections.abc import Awaitable, Callable
 from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Any
 
 from starlette.requests import Request
 from starlette.responses import JSONResponse, Response
 
+from fastmiddleware._json import json_loads
 from fastmiddleware.base import FastMVCMiddleware
 
 
@@ -21,12 +23,18 @@ class JSONSchemaConfig:
     Configuration for JSON schema middleware.
 
     Attributes:
-        schemas: Dict of path patterns to JSON schemas.
+        schemas: Dict of path patterns to JSON schemas. Read once when the
+            middleware is created; later changes are not picked up.
         strict: Return error on validation failure.
+        compiled: Compile schemas with fastjsonschema (requires fastjsonschema).
+            Validation then follows full JSON Schema semantics and stops at
+            the first error, so a body the built-in checks accept may be
+            rejected and errors holds a single message.
     """
 
     schemas: dict[str, dict[str, Any]] = field(default_factory=dict)
     strict: bool = True
+    compiled: bool = False
 
 
 class JSONSchemaMiddleware(FastMVCMiddleware):
@@ -66,6 +74,44 @@ class JSONSchemaMiddleware(FastMVCMiddleware):
         if schemas:
             self.config.schemas = schemas
 
+        # Compiled validators keyed like config.schemas; schemas that are
+        # missing here are checked by the built-in _validate instead
+        self._fastjsonschema = None
+        self._validators: dict[str, Callable[[Any], Any]] = {}
+        if self.config.compiled:
+            try:
+                import fastjsonschema
+            except ImportError as err:
+                raise ImportError(
+                    "fastjsonschema is required for compiled validation. "
+                    "Install it with: pip install fastjsonschema"
+                ) from err
+            self._fastjsonschema = fastjsonschema
+            self._validators = self._compile_validators(fastjsonschema, self.config.schemas)
+
+        # Routing structures for _get_schema_key. Method keys look like
+        # "POST:/path"; prefixes keep config order so the first match wins.
+        self._has_method_keys = any(":" in key for key in self.config.schemas)
+        self._prefixes = tuple((key.rstrip("*"), key) for key in self.config.schemas)
+
+        # APIs hit a small set of (path, method) pairs, so memoize the routing
+        self._get_schema_key = lru_cache(maxsize=1024)(self._match_schema_key)
+
+    @staticmethod
+    def _compile_validators(
+        fastjsonschema: Any,
+        schemas: dict[str, dict[str, Any]],
+    ) -> dict[str, Callable[[Any], Any]]:
+        """Compile schemas with fastjsonschema."""
+        validators = {}
+        for key, schema in schemas.items():
+            try:
+                validators[key] = fastjsonschema.compile(schema)
+            except fastjsonschema.JsonSchemaDefinitionException:
+                # Not a valid JSON Schema; keep the lenient built-in checks
+                continue
+        return validators
+
     def _validate_type(self, value: Any, schema_type: str) -> bool:
         """Basic type validation."""
         type_map = {
@@ -147,24 +193,34 @@ class JSONSchemaMiddleware(FastMVCMiddleware):
 
         return len(errors) == 0, errors
 
-    def _get_schema(self, path: str, method: str) -> dict[str, Any] | None:
-        """Get schema for path."""
+    def _match_schema_key(self, path: str, method: str) -> str | None:
+        """Get the config.schemas key matching path (uncached)."""
+        schemas = self.config.schemas
+
         # Try exact match with method
-        key = f"{method}:{path}"
-        if key in self.config.schemas:
-            return self.config.schemas[key]
+        if self._has_method_keys:
+            key = f"{method}:{path}"
+            if key in schemas:
+                return key
 
         # Try path only
-        if path in self.config.schemas:
-            return self.config.schemas[path]
+        if path in schemas:
+            return path
 
         # Try prefix match
-        for pattern in self.config.schemas:
-            if path.startswith(pattern.rstrip("*")):
-                return self.config.schemas[pattern]
+        for prefix, pattern in self._prefixes:
+            if path.startswith(prefix):
+                return pattern
 
         return None
 
+    def _get_schema(self, path: str, method: str) -> dict[str, Any] | None:
+        """Get schema for path."""
+        key = self._get_schema_key(path, method)
+        if key is None:
+            return None
+        return self.config.schemas[key]
+
     async def dispatch(
         self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
     ) -> Response:
@@ -172,14 +228,19 @@ class JSONSchemaMiddleware(FastMVCMiddleware):
             return await call_next(request)
 
         # Only validate methods with body
-        if request.method not in {"POST", "PUT", "PATCH"}:
+        method = request.method
+        if method not in {"POST", "PUT", "PATCH"}:
             return await call_next(request)
 
-        schema = self._get_schema(request.url.path, request.method)
+        schema_key = self._get_schema_key(request.scope["path"], method)
+        if schema_key is None:
+            return await call_next(request)
+        schema = self.config.schemas[schema_key]
         if not schema:
             return await call_next(request)
 
-        # Parse body
+        # Parse body. request.body() joins the stream once and caches it, and
+        # that cache is what lets the route handler read the body again.
         try:
             body = await request.body()
             if not body:
@@ -190,7 +251,7 @@ class JSONSchemaMiddleware(FastMVCMiddleware):
                     )
                 return await call_next(request)
 
-            data = json.loads(body)
+            data = json_loads(body)
         except json.JSONDecodeError as e:
             return JSONResponse(
                 status_code=400,
@@ -202,7 +263,16 @@ class JSONSchemaMiddleware(FastMVCMiddleware):
             )
 
         # Validate
-        valid, errors = self._validate(data, schema)
+        validator = self._validators.get(schema_key)
+        if validator is not None:
+            try:
+                validator(data)
+            except self._fastjsonschema.JsonSchemaValueException as e:
+                valid, errors = False, [e.message]
+            else:
+                valid, errors = True, []
+        else:
+            valid, errors = self._validate(data, schema)
 
         if not valid and self.config.strict:
             return JSONResponse(
@@ -7,6 +7,8 @@ Provides language detection and localization support.
 from collections.abc import Awaitable, Callable
 from contextvars import ContextVar
 from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import AnyStr
 
 from starlette.requests import Request
 from starlette.responses import Response
@@ -17,6 +19,11 @@ from fastmiddleware.base import FastMVCMiddleware
 # Context variable for locale
 _locale_ctx: ContextVar[str | None] = ContextVar("locale", default=None)
 
+# Bound once so dispatch skips the method lookup on every request. Starlette
+# runs each request in its own task, so the reset is a safety net only.
+_set_locale = _locale_ctx.set
+_reset_locale = _locale_ctx.reset
+
 
 def get_locale() -> str | None:
     """
@@ -50,6 +57,8 @@ class LocaleConfig:
         locale_query_param: Query param to check for locale.
         locale_cookie: Cookie name for locale preference.
         fallback_chain: Whether to try language without region.
+        max_header_bytes: Accept-Language values longer than this are ignored.
+        max_segments: Maximum number of Accept-Language entries parsed.
 
     Example:
         ```python
@@ -69,6 +78,8 @@ class LocaleConfig:
     locale_cookie: str = "locale"
     fallback_chain: bool = True
     set_cookie: bool = True
+    max_header_bytes: int = 2048
+    max_segments: int = 64
 
 
 class LocaleMiddleware(FastMVCMiddleware):
@@ -132,78 +143,179 @@ class LocaleMiddleware(FastMVCMiddleware):
         if default_locale is not None:
             self.config.default_locale = default_locale
 
+        # Lowercased lookups built once; fallback maps a bare language
+        # ("en") to the first supported entry without a region
+        self._supported_lower: dict[str, str] = {}
+        self._base_fallback: dict[str, str] = {}
+        for loc in self.config.supported_locales:
+            loc_lower = loc.lower()
+            self._supported_lower.setdefault(loc_lower, loc)
+            if "-" not in loc_lower:
+                self._base_fallback.setdefault(loc_lower, loc)
+
+        self._cookie_prefix = f"{self.config.locale_cookie}=".encode("latin-1")
+        self._header_key = self.config.locale_header.lower().encode("latin-1")
+
+        # Clients send a handful of distinct values, so resolve each only once
+        self._resolve_header = lru_cache(maxsize=1024)(self._resolve_accept_language)
+        self._resolve_token = lru_cache(maxsize=256)(self._resolve_locale)
+
     def _parse_accept_language(self, header: str) -> list[str]:
         """Parse Accept-Language header into sorted list of locales."""
         if not header:
             return []
+        return [loc for loc, _ in self._scan_accept_language(header, ",", ";", "q=")]
 
-        locales = []
-        for raw_part in header.split(","):
-            part = raw_part.strip()
-            if not part:
-                continue
+    def _parse_accept_language_bytes(self, header: bytes) -> list[str]:
+        """Parse a raw ASCII Accept-Language header, decoding only the locales."""
+        if not header:
+            return []
+        return [
+            loc.decode("ascii") for loc, _ in self._scan_accept_language(header, b",", b";", b"q=")
+        ]
+
+    def _scan_accept_language(
+        self, header: AnyStr, comma: AnyStr, semi_sep: AnyStr, q_sep: AnyStr
+    ) -> list[tuple[AnyStr, float]]:
+        """
+        Split an Accept-Language value into (locale, quality) pairs.
+
+        Works on str or bytes alike; find() on bytes is a plain memchr-style
+        C scan. Pairs come back sorted by quality, highest first. Overlong
+        headers yield nothing and entries past max_segments are ignored,
+        bounding the work a hostile client can cause.
+        """
+        length = len(header)
+        if length > self.config.max_header_bytes:
+            return []
 
-            # Parse quality factor
-            if ";q=" in part:
-                locale, q = part.split(";q=")
+        max_segments = self.config.max_segments
+        locales: list[tuple[AnyStr, float]] = []
+        needs_sort = False
+        pos = 0
+
+        # One left-to-right walk: slice each entry by index, no split chains
+        while pos < length and len(locales) < max_segments:
+            end = header.find(comma, pos)
+            if end == -1:
+                end = length
+
+            semi = header.find(semi_sep, pos, end)
+            if semi == -1:
+                locale = header[pos:end].strip()
+                quality = 1.0
+            else:
+                locale = header[pos:semi].strip()
+                quality = self._parse_quality(header, semi_sep, q_sep, semi + 1, end)
+                if quality != 1.0:
+                    needs_sort = True
+
+            if locale:
+                locales.append((locale, quality))
+            pos = end + 1
+
+        # All-default qualities are already in preference order
+        if needs_sort:
+            locales.sort(key=lambda x: x[1], reverse=True)
+        return locales
+
+    @staticmethod
+    def _parse_quality(
+        header: AnyStr, semi_sep: AnyStr, q_sep: AnyStr, start: int, end: int
+    ) -> float:
+        """
+        Parse the q parameter in header[start:end], defaulting to 1.0.
+
+        Only a parameter that itself starts with "q=" counts, so ";freq=1"
+        is not read as a quality. Unparseable values count as 1.0.
+        """
+        pos = start
+        while pos <= end:
+            param_end = header.find(semi_sep, pos, end)
+            if param_end == -1:
+                param_end = end
+            param = header[pos:param_end].strip()
+            if param.startswith(q_sep):
                 try:
-                    quality = float(q)
+                    return float(param[2:].strip())
                 except ValueError:
-                    quality = 1.0
-            else:
-                locale = part
-                quality = 1.0
+                    return 1.0
+            pos = param_end + 1
+        return 1.0
 
-            locales.append((locale.strip(), quality))
+    def _find_best_match(self, requested: list[str]) -> str:
+        """
+        Find best matching supported locale.
 
-        # Sort by quality descending
-        locales.sort(key=lambda x: x[1], reverse=True)
-        return [loc for loc, _ in locales]
+        Matching runs in tiers, cheapest first:
+            1. A single requested locale that is supported as sent
+            2. Exact match after normalizing (en_us -> en-us)
+            3. Base language without region (en-US -> en)
+        """
+        supported_lower = self._supported_lower
 
-    def _normalize_locale(self, locale: str) -> str:
-        """Normalize locale format (en_US -> en-US)."""
-        return locale.replace("_", "-")
+        # Tier 1: one requested locale (query, cookie, most browsers)
+        if len(requested) == 1:
+            match = supported_lower.get(requested[0].lower())
+            if match is not None:
+                return match
 
-    def _find_best_match(self, requested: list[str]) -> str:
-        """Find best matching supported locale."""
-        supported_lower = {loc.lower(): loc for loc in self.config.supported_locales}
+        base_fallback = self._base_fallback if self.config.fallback_chain else None
 
         for raw_locale in requested:
-            locale = self._normalize_locale(raw_locale)
-            locale_lower = locale.lower()
+            locale_lower = raw_locale.replace("_", "-").lower()
+
+            # Tier 2: exact match
+            match = supported_lower.get(locale_lower)
+            if match is not None:
+                return match
 
-            # Exact match
-            if locale_lower in supported_lower:
-                return supported_lower[locale_lower]
+            # Tier 3: try without region
+            if base_fallback:
+                base, sep, _ = locale_lower.partition("-")
+                if sep and base in base_fallback:
+                    return base_fallback[base]
 
-            # Try without region (en-US -> en)
-            if self.config.fallback_chain and "-" in locale:
-                base = locale.split("-")[0].lower()
-                if base in supported_lower:
-                    return supported_lower[base]
+        return self.config.default_locale
+
+    def _resolve_locale(self, locale: str) -> str:
+        """Resolve a single requested locale (query param or cookie)."""
+        return self._find_best_match([locale])
 
+    def _resolve_accept_language(self, header: bytes) -> str:
+        """Resolve a raw Accept-Language header value to a supported locale."""
+        if header.isascii():
+            locales = self._parse_accept_language_bytes(header)
+        else:
+            locales = self._parse_accept_language(header.decode("latin-1"))
+        if locales:
+            return self._find_best_match(locales)
         return self.config.default_locale
 
     def _detect_locale(self, request: Request) -> str:
         """Detect locale from request."""
+        config = self.config
+
         # 1. Check query parameter
-        query_locale = request.query_params.get(self.config.locale_query_param)
+        query_locale = request.query_params.get(config.locale_query_param)
         if query_locale:
-            return self._find_best_match([query_locale])
+            return self._resolve_token(query_locale)
 
         # 2. Check cookie
-        cookie_locale = request.cookies.get(self.config.locale_cookie)
+        cookie_locale = request.cookies.get(config.locale_cookie)
         if cookie_locale:
-            return self._find_best_match([cookie_locale])
+            return self._resolve_token(cookie_locale)
 
-        # 3. Parse Accept-Language
-        accept_lang = request.headers.get(self.config.locale_header, "")
-        locales = self._parse_accept_language(accept_lang)
-        if locales:
-            return self._find_best_match(locales)
+        # 3. Parse Accept-Language, read straight from the raw ASGI headers
+        for key, value in request.scope["headers"]:
+            if key == self._header_key:
+                # Check the length before the cache so overlong values never become keys
+                if value and len(value) <= config.max_header_bytes:
+                    return self._resolve_header(value)
+                break
 
         # 4. Default
-        return self.config.default_locale
+        return config.default_locale
 
     async def dispatch(
         self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
@@ -215,16 +327,25 @@ class LocaleMiddleware(FastMVCMiddleware):
         locale = self._detect_locale(request)
 
         # Set context
-        token = _locale_ctx.set(locale)
+        token = _set_locale(locale)
         request.state.locale = locale
 
         try:
             response = await call_next(request)
 
+            # Respect a locale cookie or Content-Language the app already set
+            has_cookie = has_language = False
+            for key, value in response.raw_headers:
+                if key == b"set-cookie" and value.startswith(self._cookie_prefix):
+                    has_cookie = True
+                elif key == b"content-language":
+                    has_language = True
+
             # Set cookie if configured
-            if self.config.set_cookie:
+            config = self.config
+            if config.set_cookie and not has_cookie:
                 response.set_cookie(
-                    key=self.config.locale_cookie,
+                    key=config.locale_cookie,
                     value=locale,
                     max_age=365 * 24 * 60 * 60,  # 1 year
                     httponly=False,
@@ -232,8 +353,9 @@ class LocaleMiddleware(FastMVCMiddleware):
                 )
 
             # Add Content-Language header
-            response.headers["Content-Language"] = locale
+            if not has_language:
+                response.raw_headers.append((b"content-language", locale.encode("latin-1")))
 
             return response
         finally:
-            _locale_ctx.reset(token)
+            _reset_locale(token)
@@ -13,6 +13,11 @@ from starlette.responses import Response
 from fastmiddleware.base import FastMVCMiddleware
 
 
+_CACHE_CONTROL = b"no-store, no-cache, must-revalidate, private"
+_PRAGMA = b"no-cache"
+_EXPIRES = b"0"
+
+
 @dataclass
 class NoCacheConfig:
     """
@@ -66,15 +71,26 @@ class NoCacheMiddleware(FastMVCMiddleware):
         if paths:
             self.config.paths = paths
 
+        # Header pairs are fixed by config, so encode them once
+        self._headers = [(b"cache-control", _CACHE_CONTROL)]
+        if self.config.pragma:
+            self._headers.append((b"pragma", _PRAGMA))
+        if self.config.expires:
+            self._headers.append((b"expires", _EXPIRES))
+
+        # str.startswith accepts a tuple and checks every prefix in C
+        self._paths = tuple(self.config.paths)
+        self._methods = frozenset(self.config.methods)
+
     def _should_apply(self, path: str, method: str) -> bool:
         """Check if no-cache should apply."""
-        if method not in self.config.methods:
+        if method not in self._methods:
             return False
 
-        if not self.config.paths:
+        if not self._paths:
             return True
 
-        return any(path.startswith(p) for p in self.config.paths)
+        return path.startswith(self._paths)
 
     async def dispatch(
         self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
@@ -85,12 +101,9 @@ class NoCacheMiddleware(FastMVCMiddleware):
         response = await call_next(request)
 
         if self._should_apply(request.url.path, request.method):
-            response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, private"
-
-            if self.config.pragma:
-                response.headers["Pragma"] = "no-cache"
-
-            if self.config.expires:
-                response.headers["Expires"] = "0"
+            # Already uncacheable upstream; leave the app's headers alone
+            if "no-store" in response.headers.get("cache-control", ""):
+                return response
+            self.set_raw_headers(response, self._headers)
 
         return response
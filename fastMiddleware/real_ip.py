@@ -4,6 +4,7 @@ Real IP Middleware for FastMVC.
 Extracts real client IP from various proxy headers.
 """
 
+import ipaddress
 from collections.abc import Awaitable, Callable
 from contextvars import ContextVar
 from dataclasses import dataclass, field
@@ -16,6 +17,10 @@ from fastmiddleware.base import FastMVCMiddleware
 
 _real_ip_ctx: ContextVar[str | None] = ContextVar("real_ip", default=None)
 
+# Pre-bound setters for the per-request hot path
+_set_real_ip = _real_ip_ctx.set
+_reset_real_ip = _real_ip_ctx.reset
+
 
 def get_real_ip() -> str | None:
     """Get real client IP."""
@@ -29,7 +34,10 @@ class RealIPConfig:
 
     Attributes:
         headers: Headers to check for real IP (in order).
-        trusted_proxies: Trusted proxy IP addresses.
+        trusted_proxies: Trusted proxy IPs/CIDRs. When set, the headers are
+            only read if the direct peer is trusted, and the X-Forwarded-For
+            chain is read right to left so the first untrusted address wins;
+            otherwise the leftmost valid one is used.
     """
 
     headers: list[str] = field(
@@ -76,19 +84,63 @@ class RealIPMiddleware(FastMVCMiddleware):
         if headers:
             self.config.headers = headers
 
+        self._headers = tuple(self.config.headers)
+        # Parsed once so "::1" and "0:0::1" compare equal. Single-host entries
+        # go in a set for O(1) lookup; real ranges are checked one by one.
+        networks = [
+            ipaddress.ip_network(entry, strict=False) for entry in self.config.trusted_proxies
+        ]
+        self._trusted_hosts = frozenset(
+            net.network_address for net in networks if net.prefixlen == net.max_prefixlen
+        )
+        self._trusted_networks = tuple(
+            net for net in networks if net.prefixlen != net.max_prefixlen
+        )
+        self._trusted = bool(networks)
+
+    @staticmethod
+    def _parse_ip(value: str) -> ipaddress.IPv4Address | ipaddress.IPv6Address | None:
+        """Parse an address, returning None for anything that is not an IP."""
+        try:
+            return ipaddress.ip_address(value)
+        except ValueError:
+            return None
+
+    def _is_trusted(self, ip: ipaddress.IPv4Address | ipaddress.IPv6Address) -> bool:
+        """Check whether an address is one of the trusted proxies."""
+        if ip in self._trusted_hosts:
+            return True
+        return any(ip in net for net in self._trusted_networks)
+
     def _get_real_ip(self, request: Request) -> str:
         """Get real client IP from headers."""
-        for header in self.config.headers:
-            value = request.headers.get(header)
-            if value:
-                # X-Forwarded-For can contain multiple IPs
-                ip = value.split(",")[0].strip() if "," in value else value.strip()
-
-                if ip:
-                    return ip
+        client = request.scope.get("client")
+        if self._trusted:
+            # Forwarding headers only count when a trusted proxy sent them
+            peer = self._parse_ip(client[0]) if client else None
+            if peer is None or not self._is_trusted(peer):
+                return client[0] if client else "unknown"
+
+        headers = request.headers
+        for header in self._headers:
+            value = headers.get(header)
+            if not value:
+                continue
+
+            # X-Forwarded-For can contain multiple IPs
+            candidates = [ip.strip() for ip in value.split(",")]
+            if self._trusted:
+                # Peel trusted proxies off the right; the hop before them is the client
+                for ip in reversed(candidates):
+                    parsed = self._parse_ip(ip)
+                    if parsed is not None and not self._is_trusted(parsed):
+                        return ip
+            else:
+                for ip in candidates:
+                    if self._parse_ip(ip) is not None:
+                        return ip
 
         # Fall back to direct connection IP
-        client = request.scope.get("client")
         return client[0] if client else "unknown"
 
     async def dispatch(
@@ -99,11 +151,11 @@ class RealIPMiddleware(FastMVCMiddleware):
 
         real_ip = self._get_real_ip(request)
 
-        token = _real_ip_ctx.set(real_ip)
+        token = _set_real_ip(real_ip)
         request.state.real_ip = real_ip
 
         try:
             response = await call_next(request)
             return response
         finally:
-            _real_ip_ctx.reset(token)
+            _reset_real_ip(token)
@@ -39,6 +39,7 @@ class RequestIDPropagationConfig:
         response_header: Header for response.
         generate_if_missing: Generate ID if none found.
         max_chain: Maximum chain length to preserve.
+        max_header_bytes: Header values longer than this are ignored.
     """
 
     headers: list[str] = field(
@@ -51,6 +52,7 @@ class RequestIDPropagationConfig:
     response_header: str = "X-Request-ID"
     generate_if_missing: bool = True
     max_chain: int = 10
+    max_header_bytes: int = 2048
 
 
 class RequestIDPropagationMiddleware(FastMVCMiddleware):
@@ -82,21 +84,30 @@ class RequestIDPropagationMiddleware(FastMVCMiddleware):
     ) -> None:
         super().__init__(app, exclude_paths=exclude_paths)
         self.config = config or RequestIDPropagationConfig()
+        self._response_header = self.config.response_header.lower().encode("latin-1")
 
     def _extract_ids(self, request: Request) -> list[str]:
         """Extract request IDs from headers."""
-        ids = []
+        max_chain = self.config.max_chain
+        max_header_bytes = self.config.max_header_bytes
+        ids: list[str] = []
+        seen: set[str] = set()
 
         for header in self.config.headers:
             value = request.headers.get(header)
-            if value:
+            # Overlong values are dropped rather than split into huge lists
+            if value and len(value) <= max_header_bytes:
                 # Handle comma-separated IDs
                 for raw_id_val in value.split(","):
                     id_val = raw_id_val.strip()
-                    if id_val and id_val not in ids:
+                    if id_val and id_val not in seen:
+                        if len(ids) >= max_chain:
+                            # Anything further would be trimmed anyway
+                            return ids
+                        seen.add(id_val)
                         ids.append(id_val)
 
-        return ids[: self.config.max_chain]
+        return ids
 
     async def dispatch(
         self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
@@ -105,12 +116,15 @@ class RequestIDPropagationMiddleware(FastMVCMiddleware):
             return await call_next(request)
 
         ids = self._extract_ids(request)
+        max_chain = self.config.max_chain
 
         # Generate new ID for this service
         if self.config.generate_if_missing or ids:
-            new_id = str(uuid.uuid4())
+            new_id = uuid.uuid4().hex
             ids.append(new_id)
-            ids = ids[-self.config.max_chain :]  # Limit chain length
+            # Limit chain length, trimming in place
+            if len(ids) > max_chain:
+                del ids[:-max_chain]
 
         token = _request_ids_ctx.set(ids)
         request.state.request_ids = ids
@@ -120,9 +134,10 @@ class RequestIDPropagationMiddleware(FastMVCMiddleware):
 
             # Add current request ID to response
             if ids:
-                response.headers[self.config.response_header] = ids[-1]
+                headers = [(self._response_header, ids[-1].encode("latin-1"))]
                 if len(ids) > 1:
-                    response.headers["X-Request-Chain"] = ",".join(ids)
+                    headers.append((b"x-request-chain", ",".join(ids).encode("latin-1")))
+                self.set_raw_headers(response, headers)
 
             return response
         finally:
@@ -15,6 +15,9 @@ from starlette.responses import Response
 from fastmiddleware.base import FastMVCMiddleware
 
 
+_perf_counter_ns = time.perf_counter_ns
+
+
 @dataclass
 class ResponseTimeSLA:
     """Response time SLA definition."""
@@ -25,6 +28,20 @@ class ResponseTimeSLA:
     critical_ms: float
 
 
+class _PathStats:
+    """Mutable per-path counters, allocated once per path."""
+
+    __slots__ = ("count", "critical", "max_ms", "min_ms", "total_ms", "warnings")
+
+    def __init__(self, duration_ms: float) -> None:
+        self.count = 1
+        self.total_ms = duration_ms
+        self.max_ms = duration_ms
+        self.min_ms = duration_ms
+        self.warnings = 0
+        self.critical = 0
+
+
 @dataclass
 class ResponseTimeConfig:
     """
@@ -79,47 +96,56 @@ class ResponseTimeMiddleware(FastMVCMiddleware):
         super().__init__(app, exclude_paths=exclude_paths)
         self.config = config or ResponseTimeConfig()
         self._logger = logging.getLogger(self.config.logger_name)
+        self._header_name = self.config.header_name.lower().encode("latin-1")
 
         # Stats tracking
-        self._stats: dict[str, dict] = {}
-
-    def _get_sla(self, path: str) -> tuple[float, float, float]:
-        """Get SLA thresholds for path."""
-        for sla in self.config.slas:
-            if path.startswith(sla.path_pattern):
-                return sla.target_ms, sla.warning_ms, sla.critical_ms
+        self._stats: dict[str, _PathStats] = {}
 
-        return (
+        # SLA table flattened once; first matching prefix still wins
+        self._slas = tuple(
+            (sla.path_pattern, (sla.target_ms, sla.warning_ms, sla.critical_ms))
+            for sla in self.config.slas
+        )
+        self._default_sla = (
             self.config.default_target_ms,
             self.config.default_warning_ms,
             self.config.default_critical_ms,
         )
 
-    def _update_stats(self, path: str, duration_ms: float) -> None:
-        """Update stats for path."""
-        if path not in self._stats:
-            self._stats[path] = {
-                "count": 0,
-                "total_ms": 0.0,
-                "max_ms": 0.0,
-                "min_ms": float("inf"),
-                "warnings": 0,
-                "critical": 0,
-            }
+    def _get_sla(self, path: str) -> tuple[float, float, float]:
+        """Get SLA thresholds for path."""
+        for pattern, thresholds in self._slas:
+            if path.startswith(pattern):
+                return thresholds
+
+        return self._default_sla
 
-        stats = self._stats[path]
-        stats["count"] += 1
-        stats["total_ms"] += duration_ms
-        stats["max_ms"] = max(stats["max_ms"], duration_ms)
-        stats["min_ms"] = min(stats["min_ms"], duration_ms)
+    def _update_stats(self, path: str, duration_ms: float) -> _PathStats:
+        """Update stats for path, returning its record."""
+        stats = self._stats.get(path)
+        if stats is None:
+            stats = self._stats[path] = _PathStats(duration_ms)
+            return stats
+
+        stats.count += 1
+        stats.total_ms += duration_ms
+        stats.max_ms = max(stats.max_ms, duration_ms)
+        stats.min_ms = min(stats.min_ms, duration_ms)
+        return stats
 
     def get_stats(self) -> dict[str, dict]:
         """Get response time statistics."""
         result = {}
         for path, stats in self._stats.items():
+            count = stats.count
             result[path] = {
-                **stats,
-                "avg_ms": stats["total_ms"] / stats["count"] if stats["count"] > 0 else 0,
+                "count": count,
+                "total_ms": stats.total_ms,
+                "max_ms": stats.max_ms,
+                "min_ms": stats.min_ms,
+                "warnings": stats.warnings,
+                "critical": stats.critical,
+                "avg_ms": stats.total_ms / count if count > 0 else 0,
             }
         return result
 
@@ -129,33 +155,41 @@ class ResponseTimeMiddleware(FastMVCMiddleware):
         if self.should_skip(request):
             return await call_next(request)
 
-        start = time.perf_counter()
+        start = _perf_counter_ns()
         response = await call_next(request)
-        duration_ms = (time.perf_counter() - start) * 1000
+        duration_ms = (_perf_counter_ns() - start) / 1_000_000
+
+        path = request.url.path
 
         # Get SLA thresholds
-        _target, warning, critical = self._get_sla(request.url.path)
+        _target, warning, critical = self._get_sla(path)
 
         # Update stats
-        self._update_stats(request.url.path, duration_ms)
+        stats = self._update_stats(path, duration_ms)
 
-        # Check thresholds
+        # Check thresholds; counters are kept even if the logger drops records
         if self.config.log_slow:
             if duration_ms >= critical:
+                stats.critical += 1
                 self._logger.error(
-                    f"CRITICAL: {request.method} {request.url.path} took {duration_ms:.2f}ms "
-                    f"(critical: {critical}ms)"
+                    "CRITICAL: %s %s took %.2fms (critical: %sms)",
+                    request.method,
+                    path,
+                    duration_ms,
+                    critical,
                 )
-                self._stats[request.url.path]["critical"] += 1
             elif duration_ms >= warning:
+                stats.warnings += 1
                 self._logger.warning(
-                    f"WARNING: {request.method} {request.url.path} took {duration_ms:.2f}ms "
-                    f"(warning: {warning}ms)"
+                    "WARNING: %s %s took %.2fms (warning: %sms)",
+                    request.method,
+                    path,
+                    duration_ms,
+                    warning,
                 )
-                self._stats[request.url.path]["warnings"] += 1
 
         # Add header
         if self.config.add_header:
-            response.headers[self.config.header_name] = f"{duration_ms:.2f}ms"
+            self.set_raw_headers(response, [(self._header_name, b"%.2fms" % duration_ms)])
 
         return response
@@ -5,11 +5,14 @@ This file contains shared fixtures used across all test modules.
 """
 
 import asyncio
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 
+import httpx
 import pytest
 from fastapi import FastAPI, Request
+from starlette.routing import Route, Router
 from starlette.testclient import TestClient
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 
 # Configure pytest-asyncio
@@ -33,6 +36,14 @@ def client(app: FastAPI) -> TestClient:
     return TestClient(app)
 
 
+@pytest.fixture
+async def async_client(app) -> AsyncGenerator[httpx.AsyncClient, None]:
+    """Create an in-process async client for the ASGI application."""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        yield client
+
+
 @pytest.fixture
 def app_with_routes() -> FastAPI:
     """Create a FastAPI application with common test routes."""
@@ -328,6 +339,79 @@ def make_request(client: TestClient, method: str, path: str, **kwargs) -> dict:
         return {"status_code": response.status_code, "text": response.text}
 
 
+class _OKEndpoint:
+    """
+    Raw ASGI endpoint that answers a plain-text OK.
+
+    Route treats a non-function endpoint as an ASGI app, so this skips the
+    Request and PlainTextResponse construction on every call. Messages and
+    the header list are built fresh per call because middlewares mutate the
+    response headers in place.
+    """
+
+    _BODY = b"OK"
+    _CONTENT_TYPE = b"text/plain; charset=utf-8"
+    _CONTENT_LENGTH = str(len(_BODY)).encode()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-length", self._CONTENT_LENGTH),
+                    (b"content-type", self._CONTENT_TYPE),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": self._BODY})
+
+
+ok_endpoint = _OKEndpoint()
+
+
+def make_app(
+    middleware_cls,
+    handler=ok_endpoint,
+    path: str = "/",
+    methods=None,
+    app_routes: list[Route] | None = None,
+    **kwargs,
+) -> ASGIApp:
+    """
+    Wrap a router in one middleware.
+
+    The router serves ``handler`` at ``path`` unless explicit ``app_routes``
+    are given. The middleware is constructed directly around a bare Router,
+    skipping Starlette's default error and exception middleware; tests that
+    exercise exception handling should build a full Starlette app instead.
+    """
+    if app_routes is None:
+        app_routes = [Route(path, handler, methods=methods)]
+    return middleware_cls(Router(routes=app_routes), **kwargs)
+
+
+def build(
+    middleware_cls,
+    handler=ok_endpoint,
+    path: str = "/",
+    methods=None,
+    app_routes: list[Route] | None = None,
+    **kwargs,
+) -> TestClient:
+    """Build a single-middleware app and return a TestClient for it."""
+    return TestClient(make_app(middleware_cls, handler, path, methods, app_routes, **kwargs))
+
+
+async def asgi_request(
+    app: ASGIApp, method: str = "GET", path: str = "/", **kwargs
+) -> httpx.Response:
+    """Send one request straight to an ASGI app, without TestClient's portal thread."""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        return await client.request(method, path, **kwargs)
+
+
 def assert_security_headers(response, hsts: bool = False):
     """Helper to assert common security headers are present."""
     assert "X-Content-Type-Options" in response.headers
@@ -1,104 +1,421 @@
 """
 Comprehensive tests for all middlewares to achieve 100% coverage.
+
+The assertions here are plain comparisons, so assertion rewriting is
+turned off for this module: PYTEST_DONT_REWRITE
 """
 
+import asyncio
+import base64
 import hashlib
 import hmac
+import importlib
+import json
+import random
+import re
+import sys
 import time
+from types import SimpleNamespace
 
+import httpx
+import pytest
 from starlette.applications import Starlette
-from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from starlette.routing import Route
 from starlette.testclient import TestClient
 
+from fastmiddleware import (
+    ABTestConfig,
+    ABTestMiddleware,
+    AcceptLanguageConfig,
+    AcceptLanguageMiddleware,
+    APIVersionHeaderMiddleware,
+    AuditMiddleware,
+    BandwidthMiddleware,
+    BasicAuthMiddleware,
+    BearerAuthMiddleware,
+    BotDetectionMiddleware,
+    BulkheadConfig,
+    BulkheadMiddleware,
+    ChaosMiddleware,
+    CircuitBreakerMiddleware,
+    ClientHintsConfig,
+    ClientHintsMiddleware,
+    ConditionalRequestMiddleware,
+    ContentNegotiationConfig,
+    ContentNegotiationMiddleware,
+    ContentTypeMiddleware,
+    ContextMiddleware,
+    CorrelationMiddleware,
+    CostTrackingMiddleware,
+    CSPReportConfig,
+    CSPReportMiddleware,
+    CSRFConfig,
+    CSRFMiddleware,
+    DataMaskingConfig,
+    DataMaskingMiddleware,
+    DeprecationInfo,
+    DeprecationMiddleware,
+    EarlyHintsMiddleware,
+    ETagMiddleware,
+    ExceptionHandlerMiddleware,
+    Experiment,
+    FeatureFlagConfig,
+    FeatureFlagMiddleware,
+    GeoIPMiddleware,
+    GracefulShutdownMiddleware,
+    HATEOASMiddleware,
+    HeaderTransformMiddleware,
+    HoneypotConfig,
+    HoneypotMiddleware,
+    HTTPSRedirectMiddleware,
+    IPFilterMiddleware,
+    JSONSchemaConfig,
+    JSONSchemaMiddleware,
+    LoadSheddingMiddleware,
+    LocaleConfig,
+    LocaleMiddleware,
+    MaskingRule,
+    MethodOverrideMiddleware,
+    NoCacheMiddleware,
+    OriginMiddleware,
+    PathRewriteMiddleware,
+    PayloadSizeMiddleware,
+    PermissionsPolicyMiddleware,
+    ProfilingMiddleware,
+    QuotaMiddleware,
+    RealIPConfig,
+    RealIPMiddleware,
+    RedirectMiddleware,
+    RedirectRule,
+    ReferrerPolicyMiddleware,
+    ReplayPreventionMiddleware,
+    RequestCoalescingMiddleware,
+    RequestDedupMiddleware,
+    RequestFingerprintMiddleware,
+    RequestIDPropagationConfig,
+    RequestIDPropagationMiddleware,
+    RequestLimitMiddleware,
+    RequestLoggerMiddleware,
+    RequestPriorityMiddleware,
+    RequestSamplerMiddleware,
+    RequestSigningMiddleware,
+    RequestValidatorMiddleware,
+    ResponseCacheMiddleware,
+    ResponseFormatMiddleware,
+    ResponseSignatureMiddleware,
+    ResponseTimeConfig,
+    ResponseTimeMiddleware,
+    ResponseTimeSLA,
+    RetryAfterMiddleware,
+    RewriteRule,
+    RouteAuthMiddleware,
+    SanitizationMiddleware,
+    ScopeMiddleware,
+    ServerTimingConfig,
+    ServerTimingMiddleware,
+    SessionConfig,
+    SessionMiddleware,
+    SlowResponseMiddleware,
+    TenantMiddleware,
+    TimeoutMiddleware,
+    TrailingSlashMiddleware,
+    UserAgentMiddleware,
+    VersioningMiddleware,
+    WarmupMiddleware,
+    WebhookMiddleware,
+    XFFTrustMiddleware,
+    add_timing,
+)
+from tests.conftest import asgi_request, build, make_app, ok_endpoint
+
+
+_BASIC_ADMIN_SECRET = "Basic " + base64.b64encode(b"admin:secret").decode()
+# Most tests issue exactly this request, so build it once
+_GET_ROOT = httpx.Request("GET", "http://testserver/")
+# Shared by CSRF tests; the middleware only reads it
+_CSRF_CONFIG = CSRFConfig(secret="test-secret-key-32-chars-long!!")
+# Pre-serialized body for _json_data; the Response itself stays per-request
+_DATA_JSON = b'{"data":"test"}'
+# Immutable path/proxy sets, safe to share across middleware instances
+_EXCLUDE = frozenset({"/health"})
+_WEBHOOK_PATHS = frozenset({"/webhook"})
+_TRUSTED = frozenset({"10.0.0.0/8"})
+# Request headers for smoke cases; httpx copies them into each request
+_HDR_TENANT = {"X-Tenant-ID": "test-tenant"}
+_HDR_UA = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
+_HDR_VERSION = {"X-API-Version": "2.0"}
+_HDR_XFF = {"X-Forwarded-For": "1.2.3.4"}
+
+
+# Shared route handlers; plain OK endpoints use ok_endpoint from conftest
+async def _json_ok(request):
+    return JSONResponse({"status": "ok"})
+
+
+async def _json_data(request):
+    return Response(_DATA_JSON, media_type="application/json")
+
+
+async def _exp_variant(request):
+    return JSONResponse({"variant": request.state.ab_variants.get("exp", "none")})
+
+
+# Starlette copies the route list, so one tuple serves every app
+_OK_ROUTES = (Route("/", ok_endpoint),)
+
 
 # ============== AB Testing ==============
 class TestABTesting:
     def test_ab_test_basic(self):
-        from fastmiddleware import ABTestMiddleware, Experiment
-
         async def homepage(request):
             return JSONResponse({"variant": request.state.ab_variants.get("test_exp", "none")})
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(
+        client = build(
             ABTestMiddleware,
+            handler=homepage,
             experiments=[Experiment(name="test_exp", variants=["a", "b"], weights=[0.5, 0.5])],
         )
-        client = TestClient(app)
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
-        assert response.json()["variant"] in ["a", "b"]
+        assert response.content in (b'{"variant":"a"}', b'{"variant":"b"}')
 
     def test_ab_test_sticky_variant(self):
-        from fastmiddleware import ABTestMiddleware, Experiment
+        client = build(
+            ABTestMiddleware,
+            handler=_exp_variant,
+            experiments=[Experiment(name="exp", variants=["x", "y"])],
+        )
+
+        # First request sets cookie
+        resp1 = client.get("/")
+        assert resp1.content in (b'{"variant":"x"}', b'{"variant":"y"}')
 
+        # Second request uses same cookie - should get same variant
+        resp2 = client.get("/")
+        assert resp2.content == resp1.content
+        assert "set-cookie" in resp1.headers
+        assert "set-cookie" not in resp2.headers
+
+    def test_ab_test_drops_unknown_cookie_entries(self):
         async def homepage(request):
-            return JSONResponse({"variant": request.state.ab_variants.get("exp", "none")})
+            return JSONResponse(request.state.ab_variants)
 
         app = Starlette(routes=[Route("/", homepage)])
         app.add_middleware(
             ABTestMiddleware, experiments=[Experiment(name="exp", variants=["x", "y"])]
         )
-        client = TestClient(app)
+        client = TestClient(app, cookies={"ab_variants": f"old:z|exp:y|@{int(time.time())}"})
 
-        # First request sets cookie
-        resp1 = client.get("/")
-        variant1 = resp1.json()["variant"]
+        response = client.get("/")
+        assert response.json() == {"exp": "y"}
+        assert "old" not in response.headers["X-AB-Variants"]
+        # The stale entry is removed from the client's cookie as well
+        assert response.cookies["ab_variants"].startswith('"exp:y|@')
 
-        # Second request uses same cookie - should get same variant
-        resp2 = client.get("/")
-        variant2 = resp2.json()["variant"]
-        assert variant1 == variant2
+    def test_ab_test_cookie_refreshes_at_half_life(self, monkeypatch):
+        ab_testing = importlib.import_module("fastmiddleware.ab_testing")
+        now = [1_000_000]
+        monkeypatch.setattr(ab_testing, "time", SimpleNamespace(time=lambda: now[0]))
 
+        client = build(
+            ABTestMiddleware,
+            handler=_exp_variant,
+            config=ABTestConfig(
+                experiments=[Experiment(name="exp", variants=["x", "y"])], cookie_max_age=100
+            ),
+        )
 
-# ============== Accept Language ==============
-class TestAcceptLanguage:
-    def test_accept_language_basic(self):
-        from fastmiddleware import AcceptLanguageMiddleware
+        first = client.get("/")
+        assert "set-cookie" in first.headers
 
-        async def homepage(request):
-            return JSONResponse({"lang": getattr(request.state, "language", "en")})
+        now[0] += 49
+        assert "set-cookie" not in client.get("/").headers
 
-        app = Starlette(routes=[Route("/", homepage)])
+        # Past half of max_age the same assignment is re-issued with a new expiry
+        now[0] += 1
+        refreshed = client.get("/")
+        assert refreshed.json() == first.json()
+        assert "Max-Age=100" in refreshed.headers["set-cookie"]
+        assert "@1000050" in refreshed.headers["set-cookie"]
+        assert "set-cookie" not in client.get("/").headers
+
+    def test_ab_test_weighted_many_variants(self):
+        variants = [f"v{i}" for i in range(10)]
+        client = build(
+            ABTestMiddleware,
+            handler=_exp_variant,
+            experiments=[Experiment(name="exp", variants=variants, weights=[0] * 9 + [3])],
+        )
+
+        for user_id in ("a", "b", "c"):
+            response = client.get("/", headers={"X-User-ID": user_id})
+            assert response.json()["variant"] == "v9"
+
+    @pytest.mark.parametrize(
+        ("variants", "weights"),
+        [
+            (["a", "b", "c"], [0.2, 0.3]),
+            (["a", "b", "c"], [0.5, 0.25, 0.25]),
+            (["a", "b"], [2.0, 1.0]),
+            (["a", "b", "c", "d"], [0.1]),
+        ],
+    )
+    def test_ab_test_sticky_buckets_match_baseline(self, variants, weights):
+        def baseline(user_id):
+            # The original md5 bucketing: raw running sum, last variant fallback
+            digest = hashlib.md5(f"exp:{user_id}".encode()).hexdigest()
+            value = (int(digest, 16) % 10000) / 10000.0
+            cumulative = 0.0
+            for variant, weight in zip(variants, weights, strict=False):
+                cumulative += weight
+                if value < cumulative:
+                    return variant
+            return variants[-1]
+
+        middleware = ABTestMiddleware(
+            None, experiments=[Experiment(name="exp", variants=variants, weights=weights)]
+        )
+        experiment = middleware._experiments["exp"]
+        for user_id in map(str, range(500)):
+            assigned = middleware._assign_variant(experiment, user_id.encode())
+            assert assigned == baseline(user_id)
+
+    def test_ab_test_alias_table_follows_weights(self):
+        weights = [0.5, 0.0, 0.3, 0.2]
+        middleware = ABTestMiddleware(
+            None,
+            config=ABTestConfig(
+                experiments=[Experiment(name="exp", variants=list("abcd"), weights=weights)],
+                sticky=False,
+                rng=random.Random(1234),
+            ),
+        )
+        experiment = middleware._experiments["exp"]
+
+        draws = 20000
+        counts = dict.fromkeys("abcd", 0)
+        for _ in range(draws):
+            counts[middleware._assign_variant(experiment, None)] += 1
+
+        # A zero weight is never drawn; the rest stay close to their weights
+        assert counts["b"] == 0
+        for variant, weight in zip("abcd", weights, strict=True):
+            assert abs(counts[variant] / draws - weight) < 0.02
+
+    def test_ab_test_seeded_rng(self):
+        def _seeded_client(seed):
+            return ABTestMiddleware(
+                None,
+                config=ABTestConfig(
+                    experiments=[Experiment(name="exp", variants=list("abcd"))],
+                    sticky=False,
+                    rng=random.Random(seed),
+                ),
+            )
+
+        first, second = _seeded_client(7), _seeded_client(7)
+        experiment = first._experiments["exp"]
+        assert [first._assign_variant(experiment, None) for _ in range(20)] == [
+            second._assign_variant(experiment, None) for _ in range(20)
+        ]
+
+    def test_ab_test_murmur3_bucketing(self):
+        pytest.importorskip("mmh3")
+
+        app = Starlette(routes=[Route("/", _exp_variant)])
         app.add_middleware(
-            AcceptLanguageMiddleware,
-            supported_languages=["en", "es", "fr"],
+            ABTestMiddleware,
+            config=ABTestConfig(
+                experiments=[Experiment(name="exp", variants=["x", "y"])],
+                hash_algorithm="murmur3",
+            ),
         )
-        client = TestClient(app)
 
-        # Test with Accept-Language header
-        response = client.get("/", headers={"Accept-Language": "es,en;q=0.9"})
-        assert response.status_code == 200
+        variants = {
+            TestClient(app).get("/", headers={"X-User-ID": "user-42"}).json()["variant"]
+            for _ in range(3)
+        }
+        assert len(variants) == 1
+        assert variants <= {"x", "y"}
 
-    def test_accept_language_default(self):
-        from fastmiddleware import AcceptLanguageMiddleware
 
+# ============== Accept Language ==============
+class TestAcceptLanguage:
+    @pytest.fixture(scope="class")
+    @classmethod
+    def app(cls):
         async def homepage(request):
             return JSONResponse({"lang": getattr(request.state, "language", "en")})
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(AcceptLanguageMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/")
-        assert response.status_code == 200
+        return make_app(AcceptLanguageMiddleware, homepage, supported_languages=["en", "es", "fr"])
+
+    @pytest.mark.parametrize(
+        "headers", [{"Accept-Language": "es,en;q=0.9"}, {}], ids=["header", "default"]
+    )
+    async def test_accept_language(self, async_client, headers):
+        response = await async_client.get("/", headers=headers)
+        assert response.status_code == 200
+
+    def test_accept_language_overlong_header_not_cached(self):
+        middleware = AcceptLanguageMiddleware(Starlette(), supported_languages=["en", "fr"])
+        module = importlib.import_module("fastmiddleware.accept_language")
+        cache_info = module._parse_accept_language_cached.cache_info
+
+        before = cache_info().currsize
+        header = "x" * 4096 + ", fr;q=0.5"
+        assert middleware._negotiate(middleware._parse_header(header)) == "fr"
+        assert cache_info().currsize == before
+
+    @pytest.mark.parametrize(
+        ("header", "expected"),
+        [
+            ("fr", "fr"),
+            ("en-GB", "en-US"),
+            ("es;q=0.5, fr;q=0.8", "fr"),
+            ("fr;q=0, es;q=0.1", "es"),
+            ("fr;q=0", "en-US"),
+            ("*", "en-US"),
+            ("de, *;q=0.5", "en-US"),
+            ("es;q=abc, fr;q=0.9", "es"),
+        ],
+        ids=[
+            "exact",
+            "primary-subtag",
+            "q-order",
+            "q-zero-skipped",
+            "q-zero-only",
+            "wildcard",
+            "wildcard-in-list",
+            "malformed-q",
+        ],
+    )
+    async def test_accept_language_negotiation(self, header, expected):
+        async def homepage(request):
+            return JSONResponse({"lang": request.state.language})
+
+        app = make_app(
+            AcceptLanguageMiddleware,
+            homepage,
+            config=AcceptLanguageConfig(
+                supported_languages=["en-US", "es", "fr"], default_language="en-US"
+            ),
+        )
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/", headers={"Accept-Language": header})
+        assert response.json() == {"lang": expected}
+        assert response.headers["Content-Language"] == expected
 
 
 # ============== API Version Header ==============
 class TestAPIVersionHeader:
     def test_api_version_header(self):
-        from fastmiddleware import APIVersionHeaderMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(APIVersionHeaderMiddleware, version="1.0.0")
-        client = TestClient(app)
+        client = build(APIVersionHeaderMiddleware, version="1.0.0")
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
         assert (
             "X-API-Version" in response.headers or response.headers.get("x-api-version") == "1.0.0"
@@ -108,109 +425,71 @@ class TestAPIVersionHeader:
 # ============== Audit ==============
 class TestAudit:
     def test_audit_logging(self):
-        from fastmiddleware import AuditMiddleware
-
-        async def homepage(request):
-            return JSONResponse({"status": "ok"})
+        client = build(AuditMiddleware, handler=_json_ok)
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(AuditMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Bandwidth ==============
 class TestBandwidth:
     def test_bandwidth_throttle(self):
-        from fastmiddleware import BandwidthMiddleware
-
         async def homepage(request):
             return PlainTextResponse("X" * 1000)
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(BandwidthMiddleware, bytes_per_second=10000)
-        client = TestClient(app)
+        client = build(BandwidthMiddleware, handler=homepage, bytes_per_second=10000)
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
-        assert len(response.text) == 1000
+        assert len(response.content) == 1000
 
 
 # ============== Basic Auth ==============
 class TestBasicAuth:
-    def test_basic_auth_success(self):
-        import base64
-
-        from fastmiddleware import BasicAuthMiddleware
-
+    @pytest.fixture(scope="class")
+    @classmethod
+    def app(cls):
         async def homepage(request):
             return PlainTextResponse(f"Hello {request.state.user}")
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(BasicAuthMiddleware, users={"admin": "secret"})
-        client = TestClient(app)
-
-        credentials = base64.b64encode(b"admin:secret").decode()
-        response = client.get("/", headers={"Authorization": f"Basic {credentials}"})
-        assert response.status_code == 200
-        assert "admin" in response.text
-
-    def test_basic_auth_failure(self):
-        from fastmiddleware import BasicAuthMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(BasicAuthMiddleware, users={"admin": "secret"})
-        client = TestClient(app)
+        return make_app(BasicAuthMiddleware, homepage, users={"admin": "secret"})
 
-        response = client.get("/")
-        assert response.status_code == 401
+    @pytest.mark.parametrize(
+        ("headers", "expected"),
+        [
+            ({"Authorization": _BASIC_ADMIN_SECRET}, 200),
+            ({}, 401),
+        ],
+        ids=["success", "failure"],
+    )
+    async def test_basic_auth(self, async_client, headers, expected):
+        response = await async_client.get("/", headers=headers)
+        assert response.status_code == expected
+        assert (b"admin" in response.content) is (expected == 200)
 
 
 # ============== Bearer Auth ==============
 class TestBearerAuth:
-    def test_bearer_auth_success(self):
-        from fastmiddleware import BearerAuthMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(BearerAuthMiddleware, tokens={"token123": {"user": "admin"}})
-        client = TestClient(app)
-
-        response = client.get("/", headers={"Authorization": "Bearer token123"})
-        assert response.status_code == 200
-
-    def test_bearer_auth_invalid(self):
-        from fastmiddleware import BearerAuthMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(BearerAuthMiddleware, tokens={"token123": {"user": "admin"}})
-        client = TestClient(app)
+    @pytest.fixture(scope="class")
+    @classmethod
+    def app(cls):
+        return make_app(BearerAuthMiddleware, tokens={"token123": {"user": "admin"}})
 
-        response = client.get("/", headers={"Authorization": "Bearer invalid"})
-        assert response.status_code == 401
+    @pytest.mark.parametrize(
+        ("token", "expected"), [("token123", 200), ("invalid", 401)], ids=["success", "invalid"]
+    )
+    async def test_bearer_auth(self, async_client, token, expected):
+        response = await async_client.get("/", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == expected
 
 
 # ============== Bot Detection ==============
 class TestBotDetection:
     def test_bot_detection(self):
-        from fastmiddleware import BotDetectionMiddleware
-
         async def homepage(request):
             return JSONResponse({"is_bot": getattr(request.state, "is_bot", False)})
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(BotDetectionMiddleware)
-        client = TestClient(app)
+        client = build(BotDetectionMiddleware, handler=homepage)
 
         # Normal user agent
         response = client.get("/", headers={"User-Agent": "Mozilla/5.0"})
@@ -224,114 +503,214 @@ class TestBotDetection:
 # ============== Bulkhead ==============
 class TestBulkhead:
     def test_bulkhead_allows_request(self):
-        from fastmiddleware import BulkheadMiddleware
+        client = build(BulkheadMiddleware, max_concurrent=10)
+
+        response = client.send(_GET_ROOT)
+        assert response.status_code == 200
+
+    async def test_bulkhead_rejects_when_queue_full(self):
+        release = asyncio.Event()
 
         async def homepage(request):
+            await release.wait()
             return PlainTextResponse("OK")
 
         app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(BulkheadMiddleware, max_concurrent=10)
-        client = TestClient(app)
+        app.add_middleware(
+            BulkheadMiddleware, config=BulkheadConfig(max_concurrent=1, max_waiting=0)
+        )
 
-        response = client.get("/")
-        assert response.status_code == 200
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = asyncio.create_task(client.get("/"))
+            await asyncio.sleep(0.05)
+            second = await client.get("/")
+            release.set()
+
+            assert second.status_code == 503
+            assert (await first).status_code == 200
+
+    async def test_bulkhead_per_path_isolates_saturated_path(self):
+        release = asyncio.Event()
+
+        async def slow(request):
+            await release.wait()
+            return PlainTextResponse("slow")
+
+        async def fast(request):
+            return PlainTextResponse("fast")
+
+        app = Starlette(routes=[Route("/slow", slow), Route("/fast", fast)])
+        app.add_middleware(
+            BulkheadMiddleware,
+            config=BulkheadConfig(
+                max_concurrent=1, max_waiting=0, per_path=True, path_limits={"/slow": 1}
+            ),
+        )
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            held = asyncio.create_task(client.get("/slow"))
+            await asyncio.sleep(0.05)
+
+            # /slow is saturated, but /fast has its own semaphore
+            rejected = await client.get("/slow")
+            other = await client.get("/fast")
+            release.set()
+
+            assert rejected.status_code == 503
+            assert other.status_code == 200
+            assert other.text == "fast"
+            assert (await held).status_code == 200
 
 
 # ============== Chaos ==============
 class TestChaos:
     def test_chaos_disabled(self):
-        from fastmiddleware import ChaosMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ChaosMiddleware, enabled=False)
-        client = TestClient(app)
+        client = build(ChaosMiddleware, enabled=False)
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Circuit Breaker ==============
 class TestCircuitBreaker:
     def test_circuit_breaker_closed(self):
-        from fastmiddleware import CircuitBreakerMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
+        client = build(CircuitBreakerMiddleware, failure_threshold=5)
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(CircuitBreakerMiddleware, failure_threshold=5)
-        client = TestClient(app)
-
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Client Hints ==============
 class TestClientHints:
     def test_client_hints(self):
-        from fastmiddleware import ClientHintsMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ClientHintsMiddleware)
-        client = TestClient(app)
+        client = build(ClientHintsMiddleware)
 
         response = client.get("/", headers={"Sec-CH-UA": '"Chromium";v="120"'})
         assert response.status_code == 200
 
+    def test_client_hints_default_headers(self):
+        client = build(ClientHintsMiddleware)
+
+        response = client.send(_GET_ROOT)
+        assert response.headers["Accept-CH"] == (
+            "Sec-CH-UA, Sec-CH-UA-Mobile, Sec-CH-UA-Platform, "
+            "Sec-CH-Prefers-Color-Scheme, Sec-CH-Prefers-Reduced-Motion, "
+            "Viewport-Width, DPR, Save-Data"
+        )
+        assert "Critical-CH" not in response.headers
+        assert "Vary" not in response.headers
+
+    def test_client_hints_custom_headers(self):
+        config = ClientHintsConfig(request_hints=["DPR", "Save-Data"], critical_hints=["DPR"])
+        client = build(ClientHintsMiddleware, config=config)
+
+        response = client.send(_GET_ROOT)
+        assert response.headers["Accept-CH"] == "DPR, Save-Data"
+        assert response.headers["Critical-CH"] == "DPR"
+        assert "Vary" not in response.headers
+
+        # Empty hint lists emit no hint headers at all
+        client = build(ClientHintsMiddleware, config=ClientHintsConfig(request_hints=[]))
+        response = client.send(_GET_ROOT)
+        assert "Accept-CH" not in response.headers
+        assert "Critical-CH" not in response.headers
+
 
 # ============== Conditional Request ==============
 class TestConditionalRequest:
     def test_conditional_request(self):
-        from fastmiddleware import ConditionalRequestMiddleware
+        client = build(ConditionalRequestMiddleware)
 
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ConditionalRequestMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Content Negotiation ==============
 class TestContentNegotiation:
     def test_content_negotiation(self):
-        from fastmiddleware import ContentNegotiationMiddleware
-
         async def homepage(request):
             return JSONResponse(
                 {"type": getattr(request.state, "content_type", "application/json")}
             )
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(
-            ContentNegotiationMiddleware, supported_types=["application/json", "application/xml"]
+        client = build(
+            ContentNegotiationMiddleware,
+            handler=homepage,
+            supported_types=["application/json", "application/xml"],
         )
-        client = TestClient(app)
 
         response = client.get("/", headers={"Accept": "application/json"})
         assert response.status_code == 200
 
+    @staticmethod
+    def _negotiating_client(**kw):
+        async def homepage(request):
+            return JSONResponse({"type": request.state.negotiated_type})
+
+        config = ContentNegotiationConfig(
+            supported_types=["application/json", "text/html", "text/plain"], **kw
+        )
+        return build(ContentNegotiationMiddleware, handler=homepage, config=config)
+
+    @pytest.mark.parametrize(
+        ("accept", "expected"),
+        [
+            ("text/plain", "text/plain"),
+            ("text/*", "text/html"),
+            ("*/*", "application/json"),
+            ("image/png, */*;q=0.1", "application/json"),
+            ("text/plain;q=0.5, text/html;q=0.9", "text/html"),
+            ("text/html;q=0.2, text/plain", "text/plain"),
+            ("image/png", "application/json"),
+        ],
+        ids=[
+            "exact",
+            "major-wildcard",
+            "full-wildcard",
+            "wildcard-fallback",
+            "q-order",
+            "q-order-default-one",
+            "lenient-default",
+        ],
+    )
+    def test_content_negotiation_picks_type(self, accept, expected):
+        client = self._negotiating_client()
+
+        response = client.get("/", headers={"Accept": accept})
+        assert response.status_code == 200
+        assert response.json() == {"type": expected}
+        assert response.headers["Vary"] == "Accept"
+
+    def test_content_negotiation_overlong_header_not_cached(self):
+        middleware = ContentNegotiationMiddleware(Starlette(), supported_types=["text/html"])
+        module = importlib.import_module("fastmiddleware.content_negotiation")
+        cache_info = module._parse_accept_cached.cache_info
+
+        before = cache_info().currsize
+        assert middleware._negotiate("x/" + "y" * 4096 + ", text/*;q=0.5") == "text/html"
+        assert cache_info().currsize == before
+
+    def test_content_negotiation_strict_rejects_unsupported(self):
+        client = self._negotiating_client(strict=True)
+
+        response = client.get("/", headers={"Accept": "image/png, audio/*"})
+        assert response.status_code == 406
+        assert response.json()["supported_types"] == [
+            "application/json",
+            "text/html",
+            "text/plain",
+        ]
+
+        response = client.get("/", headers={"Accept": "text/*"})
+        assert response.json() == {"type": "text/html"}
+
 
 # ============== Content Type ==============
 class TestContentType:
     def test_content_type_validation(self):
-        from fastmiddleware import ContentTypeMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage, methods=["POST"])])
-        app.add_middleware(ContentTypeMiddleware)
-        client = TestClient(app)
+        client = build(ContentTypeMiddleware, methods=["POST"])
 
         response = client.post("/", json={"test": 1})
         assert response.status_code == 200
@@ -340,209 +719,398 @@ class TestContentType:
 # ============== Context ==============
 class TestContext:
     def test_context_middleware(self):
-        from fastmiddleware import ContextMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ContextMiddleware)
-        client = TestClient(app)
+        client = build(ContextMiddleware)
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Correlation ==============
 class TestCorrelation:
-    def test_correlation_id(self):
-        from fastmiddleware import CorrelationMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(CorrelationMiddleware)
-        client = TestClient(app)
+    @pytest.fixture(scope="class")
+    @classmethod
+    def app(cls):
+        return make_app(CorrelationMiddleware)
 
-        response = client.get("/")
+    @pytest.mark.parametrize(
+        "headers", [{}, {"X-Correlation-ID": "test-123"}], ids=["generated", "passed"]
+    )
+    async def test_correlation_id(self, async_client, headers):
+        response = await async_client.get("/", headers=headers)
         assert response.status_code == 200
         assert "X-Correlation-ID" in response.headers or "x-correlation-id" in response.headers
 
-    def test_correlation_id_passed(self):
-        from fastmiddleware import CorrelationMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(CorrelationMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/", headers={"X-Correlation-ID": "test-123"})
-        assert response.status_code == 200
-
 
 # ============== Cost Tracking ==============
 class TestCostTracking:
     def test_cost_tracking(self):
-        from fastmiddleware import CostTrackingMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(CostTrackingMiddleware, path_costs={"/": 1.0})
-        client = TestClient(app)
+        client = build(CostTrackingMiddleware, path_costs={"/": 1.0})
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== CSP Report ==============
 class TestCSPReport:
     def test_csp_report(self):
-        from fastmiddleware import CSPReportMiddleware
+        client = build(CSPReportMiddleware, report_uri="/_csp-report")
 
-        async def homepage(request):
-            return PlainTextResponse("OK")
+        response = client.send(_GET_ROOT)
+        assert response.status_code == 200
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(CSPReportMiddleware, report_uri="/_csp-report")
-        client = TestClient(app)
+    def test_csp_report_storage_is_bounded(self):
+        reporter = CSPReportMiddleware(
+            Starlette(routes=_OK_ROUTES),
+            config=CSPReportConfig(log_reports=False, store_reports=True, max_stored=2),
+        )
+        client = TestClient(reporter)
 
-        response = client.get("/")
-        assert response.status_code == 200
+        for uri in ("a", "b", "c"):
+            response = client.post("/_csp-report", json={"csp-report": {"blocked-uri": uri}})
+            assert response.status_code == 204
+
+        assert [r["violation"]["blocked-uri"] for r in reporter.get_reports()] == ["b", "c"]
 
 
 # ============== CSRF ==============
 class TestCSRF:
     def test_csrf_get_token(self):
-        from fastmiddleware import CSRFConfig, CSRFMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        config = CSRFConfig(secret="test-secret-key-32-chars-long!!")
-        app.add_middleware(CSRFMiddleware, config=config)
-        client = TestClient(app)
+        client = build(CSRFMiddleware, config=_CSRF_CONFIG)
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Data Masking ==============
 class TestDataMasking:
     def test_data_masking(self):
-        from fastmiddleware import DataMaskingMiddleware
-
         async def homepage(request):
             return JSONResponse({"password": "secret123"})
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(DataMaskingMiddleware)
-        client = TestClient(app)
+        client = build(DataMaskingMiddleware, handler=homepage)
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
+        assert b"secret123" not in response.content
 
+    def test_masking_rule_mask_value(self):
+        assert MaskingRule(field="card").mask_value("4111111111111111") == "************1111"
+        assert MaskingRule(field="card", show_first=2, show_last=2).mask_value("abcdef") == "ab**ef"
+        assert MaskingRule(field="pin").mask_value("123") == "***"
 
-# ============== Deprecation ==============
-class TestDeprecation:
-    def test_deprecation_warning(self):
-        from fastmiddleware import DeprecationInfo, DeprecationMiddleware
+    def test_data_masking_long_value(self):
+        secret = "x" * 100
 
         async def homepage(request):
-            return PlainTextResponse("OK")
+            return JSONResponse({"password": secret})
 
-        app = Starlette(routes=[Route("/old", homepage)])
-        info = DeprecationInfo(
-            message="This endpoint is deprecated", sunset_date="2025-12-31", replacement="/new"
-        )
-        app.add_middleware(DeprecationMiddleware, deprecated_paths={"/old": info})
-        client = TestClient(app)
+        client = build(DataMaskingMiddleware, handler=homepage)
 
-        response = client.get("/old")
-        assert response.status_code == 200
+        assert client.get("/").json()["password"] == "*" * 96 + "xxxx"
 
+    def test_data_masking_large_body_in_thread(self):
+        async def homepage(request):
+            return JSONResponse({"password": "secret123", "items": list(range(100))})
 
-# ============== Early Hints ==============
-class TestEarlyHints:
-    def test_early_hints(self):
-        from fastmiddleware import EarlyHintsMiddleware
+        client = build(
+            DataMaskingMiddleware, handler=homepage, config=DataMaskingConfig(thread_threshold=16)
+        )
 
-        async def homepage(request):
-            return PlainTextResponse("OK")
+        response = client.send(_GET_ROOT)
+        assert response.json()["password"] == "*****t123"
+        assert response.json()["items"] == list(range(100))
+
+    def test_data_masking_nested_data(self):
+        middleware = DataMaskingMiddleware(Starlette())
+        clean = {"id": 1, "tags": ["a", "b"]}
+        data = {
+            "user": {"password": "secret123", "profile": clean},
+            "items": [{"token": "abcdefgh"}, [None, 1]],
+        }
+
+        masked, changed = middleware._mask_data_tracked(data)
+        assert changed
+        assert masked["user"]["password"] == "*****t123"
+        assert masked["user"]["profile"] is clean
+        assert masked["items"] == [{"token": "****efgh"}, [None, 1]]
+        assert middleware._mask_data_tracked(clean) == (clean, False)
+
+        deep: list = []
+        for _ in range(5000):
+            deep = [deep]
+        assert middleware._mask_data(deep) is deep
+
+    def test_data_masking_pattern_scan(self):
+        # Lookahead: RE2 rejects it, the stdlib alternation handles it
+        combined = DataMaskingMiddleware(
+            Starlette(),
+            config=DataMaskingConfig(patterns={"pin": r"\d{6}(?=!)", "code": r"[A-Z]{8}"}),
+        )
+        assert combined._combined_pattern is not None
+        assert combined._mask_patterns_in_string("pin 123456! ABCDEFGH") == "pin **3456! ****EFGH"
+        assert combined._mask_patterns_in_string("nothing here") == "nothing here"
+
+        # Backreference needs its own group numbering: per-pattern loop
+        looped = DataMaskingMiddleware(
+            Starlette(),
+            config=DataMaskingConfig(patterns={"twice": r"(\w{3})-\1"}),
+        )
+        assert looped._combined_pattern is None
+        assert looped._mask_patterns_in_string("abc-abc") == "***-abc"
+
+    @staticmethod
+    def _sequential_mask(patterns, text, show_last=4):
+        # Reference: baseline behaviour of one re.sub per pattern, in order
+        for pattern in patterns.values():
+            text = re.sub(
+                pattern,
+                lambda m: (
+                    "*" * max(len(m.group()) - show_last, 0) + m.group()[-show_last:]
+                    if len(m.group()) > show_last
+                    else "*" * len(m.group())
+                ),
+                text,
+            )
+        return text
+
+    @pytest.mark.parametrize("backend", ["stdlib", "re2"])
+    def test_data_masking_overlapping_patterns(self, backend, monkeypatch):
+        if backend == "re2":
+            pytest.importorskip("re2")
+        else:
+            data_masking = importlib.import_module("fastmiddleware.data_masking")
+            monkeypatch.setattr(data_masking, "re2", None)
+
+        middleware = DataMaskingMiddleware(Starlette())
+        assert middleware._combined_pattern is not None
+        if backend == "stdlib":
+            assert isinstance(middleware._combined_pattern, re.Pattern)
+
+        # Spans claimed by one default pattern are still seen by the next
+        mask = middleware._mask_patterns_in_string
+        assert mask("sms: 123456789@vtext.com") == "sms: ***************.com"
+        assert (
+            mask("card 4111-1111-1111-1111@pay.example.com")
+            == "card *******************************.com"
+        )
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(EarlyHintsMiddleware)
-        client = TestClient(app)
+        patterns = middleware.config.patterns
+        rng = random.Random(20240)
+        alphabet = "00112233445566778899 -@.com"
+        samples = [
+            "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40))) for _ in range(2000)
+        ]
+        for text in samples:
+            assert mask(text) == self._sequential_mask(patterns, text), text
 
-        response = client.get("/")
-        assert response.status_code == 200
+    def test_data_masking_skips_empty_responses(self):
+        async def no_content(request):
+            return Response(status_code=204, media_type="application/json")
 
+        async def html(request):
+            return Response('{"password": "secret123"}', media_type="text/html")
 
-# ============== ETag ==============
-class TestETag:
-    def test_etag_generation(self):
-        from fastmiddleware import ETagMiddleware
+        client = build(
+            DataMaskingMiddleware, app_routes=[Route("/empty", no_content), Route("/html", html)]
+        )
+
+        assert client.get("/empty").status_code == 204
+        assert client.get("/html").content == b'{"password": "secret123"}'
+
+    def test_data_masking_passes_clean_body_through(self):
+        body = '{ "name" : "Ada",  "tags": [1, 2] }'
 
         async def homepage(request):
-            return PlainTextResponse("Hello World")
+            return Response(body, media_type="application/json")
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ETagMiddleware)
-        client = TestClient(app)
+        client = build(DataMaskingMiddleware, handler=homepage)
 
-        response = client.get("/")
-        assert response.status_code == 200
+        response = client.send(_GET_ROOT)
+        assert response.content == body.encode()
 
+    @pytest.mark.parametrize("backend", ["stdlib", "orjson"])
+    def test_data_masking_output_bytes_match_across_backends(self, backend, monkeypatch):
+        if backend == "orjson":
+            pytest.importorskip("orjson")
+        else:
+            monkeypatch.setattr(importlib.import_module("fastmiddleware._json"), "orjson", None)
 
-# ============== Exception Handler ==============
-class TestExceptionHandler:
-    def test_exception_handler(self):
-        from fastmiddleware import ExceptionHandlerMiddleware
+        middleware = DataMaskingMiddleware(Starlette())
+        body = json.dumps({"näme": "Zoë", "password": "secret123", "n": [1, 0.5]}).encode()
+        expected = '{"näme":"Zoë","password":"*****t123","n":[1,0.5]}'.encode()
+        assert middleware._mask_body_sync(body) == expected
 
+    def test_data_masking_keeps_headers(self):
         async def homepage(request):
-            return PlainTextResponse("OK")
+            response = JSONResponse({"token": 12345678})
+            response.set_cookie("a", "1")
+            response.set_cookie("b", "2")
+            return response
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ExceptionHandlerMiddleware)
+        client = build(DataMaskingMiddleware, handler=homepage)
+
+        response = client.send(_GET_ROOT)
+        assert response.json() == {"token": "****5678"}
+        assert response.headers["content-length"] == str(len(response.content))
+        assert len(response.headers.get_list("set-cookie")) == 2
+
+    def test_data_masking_stream(self):
+        pytest.importorskip("ijson")
+
+        async def homepage(request):
+            return JSONResponse({"user": {"password": "secret123", "tags": ["a", 1]}})
+
+        client = build(
+            DataMaskingMiddleware, handler=homepage, config=DataMaskingConfig(stream=True)
+        )
+
+        response = client.send(_GET_ROOT)
+        assert response.status_code == 200
+        assert response.json() == {"user": {"password": "*****t123", "tags": ["a", 1]}}
+
+    @staticmethod
+    def _streaming_client(chunks):
+        async def body():
+            for chunk in chunks:
+                yield chunk
+
+        async def homepage(request):
+            return StreamingResponse(body(), media_type="application/json")
+
+        return build(DataMaskingMiddleware, handler=homepage, config=DataMaskingConfig(stream=True))
+
+    def test_data_masking_stream_nested_and_escaped(self):
+        pytest.importorskip("ijson")
+        document = {
+            "users": [
+                {"password": "secret123", "values": [1, 2.5, None, True, {}, []]},
+                {'access "token"': "abcdefgh", "näme": 'Zoë \\ "quoted"'},
+            ],
+            "note": "mail me@example.com",
+        }
+        body = json.dumps(document).encode()
+
+        # Chunk boundaries fall inside keys and strings
+        response = self._streaming_client([body[:7], body[7:40], body[40:]]).send(_GET_ROOT)
+        assert response.status_code == 200
+        assert "content-length" not in response.headers
+        assert response.json() == {
+            "users": [
+                {"password": "*****t123", "values": [1, 2.5, None, True, {}, []]},
+                {'access "token"': "****efgh", "näme": 'Zoë \\ "quoted"'},
+            ],
+            "note": "mail **********.com",
+        }
+
+    def test_data_masking_stream_malformed_body(self):
+        pytest.importorskip("ijson")
+
+        # The status is already sent when the error shows up, so the body
+        # stops at the last complete event instead of leaking the rest raw
+        response = self._streaming_client([b'{"password": "secret123", "a": [1,', b" 2}"]).send(
+            _GET_ROOT
+        )
+        assert response.status_code == 200
+        assert response.content == b'{"password":"*****t123","a":[1'
+
+
+# ============== Deprecation ==============
+class TestDeprecation:
+    def test_deprecation_warning(self):
+        app = Starlette(routes=[Route("/old", ok_endpoint)])
+        info = DeprecationInfo(
+            message="This endpoint is deprecated", sunset_date="2025-12-31", replacement="/new"
+        )
+        app.add_middleware(DeprecationMiddleware, deprecated_paths={"/old": info})
         client = TestClient(app)
 
-        response = client.get("/")
+        response = client.get("/old")
+        assert response.status_code == 200
+
+
+# ============== Early Hints ==============
+class TestEarlyHints:
+    def test_early_hints(self):
+        client = build(EarlyHintsMiddleware)
+
+        response = client.send(_GET_ROOT)
+        assert response.status_code == 200
+
+
+# ============== ETag ==============
+class TestETag:
+    def test_etag_generation(self):
+        async def homepage(request):
+            return PlainTextResponse("Hello World")
+
+        client = build(ETagMiddleware, handler=homepage)
+
+        response = client.send(_GET_ROOT)
+        assert response.status_code == 200
+
+
+# ============== Exception Handler ==============
+class TestExceptionHandler:
+    def test_exception_handler(self):
+        client = build(ExceptionHandlerMiddleware)
+
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Feature Flag ==============
 class TestFeatureFlag:
     def test_feature_flag(self):
-        from fastmiddleware import FeatureFlagMiddleware
-
         async def homepage(request):
             flags = getattr(request.state, "feature_flags", {})
             return JSONResponse({"flags": flags})
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(FeatureFlagMiddleware, flags={"new_feature": True, "old_feature": False})
-        client = TestClient(app)
+        client = build(
+            FeatureFlagMiddleware,
+            handler=homepage,
+            flags={"new_feature": True, "old_feature": False},
+        )
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
-
-# ============== GeoIP ==============
-class TestGeoIP:
-    def test_geoip(self):
-        from fastmiddleware import GeoIPMiddleware
+    def test_feature_flag_static_flags_isolated(self):
+        seen = []
 
         async def homepage(request):
+            flags = request.state.feature_flags
+            seen.append(dict(flags))
+            # A handler changing its own flags must not leak into later requests
+            flags["b"] = True
             return PlainTextResponse("OK")
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(GeoIPMiddleware)
-        client = TestClient(app)
+        client = build(
+            FeatureFlagMiddleware, handler=homepage, flags={"a": True, "b": False, "c": True}
+        )
+
+        assert client.get("/").headers["X-Features-Enabled"] == "a,b,c"
+        assert client.get("/").headers["X-Features-Enabled"] == "a,b,c"
+        assert seen == [{"a": True, "b": False, "c": True}] * 2
+
+    def test_feature_flag_header_overrides(self):
+        async def homepage(request):
+            return JSONResponse({"flags": request.state.feature_flags})
+
+        client = build(
+            FeatureFlagMiddleware,
+            handler=homepage,
+            config=FeatureFlagConfig(flags={"a": False, "b": True}, header_overrides=True),
+        )
+
+        response = client.get("/", headers={"X-Feature-Flags": " a = Yes, b=off, junk ,c=1"})
+        assert response.json()["flags"] == {"a": True, "b": False, "c": True}
+        assert response.headers["X-Features-Enabled"] == "a,c"
+
+
+# ============== GeoIP ==============
+class TestGeoIP:
+    def test_geoip(self):
+        client = build(GeoIPMiddleware)
 
         response = client.get("/", headers={"CF-IPCountry": "US"})
         assert response.status_code == 200
@@ -551,92 +1119,82 @@ class TestGeoIP:
 # ============== Graceful Shutdown ==============
 class TestGracefulShutdown:
     def test_graceful_shutdown_normal(self):
-        from fastmiddleware import GracefulShutdownMiddleware
+        client = build(GracefulShutdownMiddleware)
+
+        response = client.send(_GET_ROOT)
+        assert response.status_code == 200
+
+    async def test_graceful_shutdown_waits_for_in_flight(self):
+        release = asyncio.Event()
 
         async def homepage(request):
+            await release.wait()
             return PlainTextResponse("OK")
 
-        app = Starlette(routes=[Route("/", homepage)])
-        GracefulShutdownMiddleware(app)
-        client = TestClient(app)
+        shutdown_mw = GracefulShutdownMiddleware(
+            Starlette(routes=[Route("/", homepage)]), timeout=5.0
+        )
 
-        response = client.get("/")
-        assert response.status_code == 200
+        transport = httpx.ASGITransport(app=shutdown_mw)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = asyncio.create_task(client.get("/"))
+            await asyncio.sleep(0.05)
+            assert shutdown_mw.in_flight_requests == 1
+
+            shutdown = asyncio.create_task(shutdown_mw.shutdown())
+            await asyncio.sleep(0.05)
+            assert not shutdown.done()
+            assert (await client.get("/")).status_code == 503
+
+            release.set()
+            assert (await first).status_code == 200
+            await asyncio.wait_for(shutdown, timeout=1.0)
+            assert shutdown_mw.in_flight_requests == 0
 
 
 # ============== HATEOAS ==============
 class TestHATEOAS:
     def test_hateoas(self):
-        from fastmiddleware import HATEOASMiddleware
-
         async def homepage(request):
             return JSONResponse({"id": 1})
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(HATEOASMiddleware)
-        client = TestClient(app)
+        client = build(HATEOASMiddleware, handler=homepage)
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Header Transform ==============
 class TestHeaderTransform:
     def test_header_transform(self):
-        from fastmiddleware import HeaderTransformMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(HeaderTransformMiddleware, add_response_headers={"X-Custom": "value"})
-        client = TestClient(app)
+        client = build(HeaderTransformMiddleware, add_response_headers={"X-Custom": "value"})
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
         assert response.headers.get("X-Custom") == "value"
 
 
 # ============== Honeypot ==============
 class TestHoneypot:
-    def test_honeypot_normal(self):
-        from fastmiddleware import HoneypotMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(HoneypotMiddleware, honeypot_paths={"/wp-admin"})
-        client = TestClient(app)
-
-        response = client.get("/")
-        assert response.status_code == 200
-
-    def test_honeypot_trap(self):
-        from fastmiddleware import HoneypotMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
+    @pytest.fixture(scope="class")
+    @classmethod
+    def app(cls):
+        # Blocking would leak between tests sharing this app
+        config = HoneypotConfig(honeypot_paths={"/wp-admin"}, block_on_access=False, fake_delay=0)
+        return make_app(HoneypotMiddleware, config=config)
 
-        app = Starlette(routes=[Route("/", homepage), Route("/wp-admin", homepage)])
-        app.add_middleware(HoneypotMiddleware, honeypot_paths={"/wp-admin"})
-        client = TestClient(app)
-
-        client.get("/wp-admin")
-        # Should return 404 or similar
+    @pytest.mark.parametrize(
+        ("path", "expected"), [("/", 200), ("/wp-admin", 404)], ids=["normal", "trap"]
+    )
+    async def test_honeypot(self, async_client, path, expected):
+        response = await async_client.get(path)
+        assert response.status_code == expected
 
 
 # ============== HTTPS Redirect ==============
 class TestHTTPSRedirect:
     def test_https_redirect_excluded(self):
-        from fastmiddleware import HTTPSRedirectMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/health", homepage)])
-        app.add_middleware(HTTPSRedirectMiddleware, exclude_paths={"/health"})
-        client = TestClient(app)
+        client = build(HTTPSRedirectMiddleware, path="/health", exclude_paths=_EXCLUDE)
 
         response = client.get("/health")
         assert response.status_code == 200
@@ -645,79 +1203,230 @@ class TestHTTPSRedirect:
 # ============== IP Filter ==============
 class TestIPFilter:
     def test_ip_filter_allowed(self):
-        from fastmiddleware import IPFilterMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
+        app = Starlette(routes=_OK_ROUTES)
         # Don't set whitelist, so all IPs are allowed by default
         app.add_middleware(IPFilterMiddleware)
         client = TestClient(app)
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== JSON Schema ==============
 class TestJSONSchema:
     def test_json_schema(self):
-        from fastmiddleware import JSONSchemaMiddleware
-
-        async def homepage(request):
-            return JSONResponse({"status": "ok"})
-
-        app = Starlette(routes=[Route("/", homepage, methods=["POST"])])
-        app.add_middleware(JSONSchemaMiddleware, schemas={})
-        client = TestClient(app)
+        client = build(JSONSchemaMiddleware, handler=_json_ok, methods=["POST"], schemas={})
 
         response = client.post("/", json={"name": "test"})
         assert response.status_code == 200
 
+    _PERSON_SCHEMA = {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string", "pattern": "^[A-Z]"},
+            "age": {"type": "integer", "minimum": 0},
+        },
+        "required": ["name", "age"],
+        "additionalProperties": False,
+    }
+
+    def test_json_schema_rejects_invalid_body(self):
+        client = build(
+            JSONSchemaMiddleware,
+            handler=_json_ok,
+            methods=["POST"],
+            schemas={"/": self._PERSON_SCHEMA},
+        )
+
+        # Built-in checks ignore pattern and additionalProperties
+        assert client.post("/", json={"name": "bob", "age": 3, "x": 1}).status_code == 200
+
+        response = client.post("/", json={})
+        assert response.status_code == 400
+        assert response.json() == {
+            "error": True,
+            "message": "Validation failed",
+            "errors": ["Missing required field: name", "Missing required field: age"],
+        }
+
+        response = client.post("/", json={"name": 1, "age": -1})
+        assert response.json()["errors"] == [
+            "name: Expected string, got int",
+            "age: Value must be >= 0",
+        ]
+
+    def test_json_schema_compiled_validation(self):
+        pytest.importorskip("fastjsonschema")
+        client = build(
+            JSONSchemaMiddleware,
+            handler=_json_ok,
+            methods=["POST"],
+            config=JSONSchemaConfig(schemas={"/": self._PERSON_SCHEMA}, compiled=True),
+        )
+
+        assert client.post("/", json={"name": "Bob", "age": 3}).status_code == 200
+
+        response = client.post("/", json={"name": "bob", "age": 3})
+        assert response.status_code == 400
+        assert response.json() == {
+            "error": True,
+            "message": "Validation failed",
+            "errors": ["data.name must match pattern ^[A-Z]"],
+        }
+
+        response = client.post("/", json={})
+        assert response.json()["errors"] == ["data must contain ['age', 'name'] properties"]
+
+    def test_json_schema_compiled_requires_fastjsonschema(self, monkeypatch):
+        monkeypatch.setitem(sys.modules, "fastjsonschema", None)
+
+        with pytest.raises(ImportError, match="fastjsonschema is required"):
+            JSONSchemaMiddleware(Starlette(), config=JSONSchemaConfig(compiled=True))
+
+        # Without the opt-in nothing is imported
+        assert JSONSchemaMiddleware(Starlette(), schemas={"/": {}})._validators == {}
+
+    def test_json_schema_routing(self):
+        create = {"type": "object"}
+        item = {"type": "array"}
+        middleware = JSONSchemaMiddleware(
+            Starlette(),
+            schemas={"POST:/users": create, "/items/*": item},
+        )
+
+        assert middleware._get_schema("/users", "POST") is create
+        assert middleware._get_schema("/users", "PUT") is None
+        assert middleware._get_schema("/items/42", "PUT") is item
+        assert middleware._get_schema("/other", "POST") is None
+
+    def test_json_schema_compiles_validators(self):
+        pytest.importorskip("fastjsonschema")
+        schemas = {"/users": {"type": "object"}, "/bad": {"type": 5}}
+
+        middleware = JSONSchemaMiddleware(
+            Starlette(), config=JSONSchemaConfig(schemas=schemas, compiled=True)
+        )
+        assert set(middleware._validators) == {"/users"}
+
+        # Installed but not requested: the built-in checks stay in charge
+        assert JSONSchemaMiddleware(Starlette(), schemas=schemas)._validators == {}
+
 
 # ============== Load Shedding ==============
 class TestLoadShedding:
     def test_load_shedding_normal(self):
-        from fastmiddleware import LoadSheddingMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(LoadSheddingMiddleware, max_concurrent=1000)
-        client = TestClient(app)
+        client = build(LoadSheddingMiddleware, max_concurrent=1000)
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Locale ==============
 class TestLocale:
     def test_locale(self):
-        from fastmiddleware import LocaleMiddleware
+        client = build(LocaleMiddleware, supported_locales=["en", "es"])
+
+        response = client.send(_GET_ROOT)
+        assert response.status_code == 200
+
+    def test_locale_parse_accept_language(self):
+        middleware = LocaleMiddleware(Starlette())
+        parse = middleware._parse_accept_language
+
+        assert parse("fr;q=0.5, en-US, de;q=0.8,,") == ["en-US", "de", "fr"]
+        assert parse("es ; q=0.2, it;level=1") == ["it", "es"]
+        assert parse("en;q=0.5;q=0.3") == ["en"]
+        assert parse("en;q=banana") == ["en"]
+        assert len(parse(",".join(["xx"] * 100))) == middleware.config.max_segments
+        assert parse("en," + "x" * 4096) == []
+
+    def test_locale_overlong_header_not_cached(self):
+        middleware = LocaleMiddleware(Starlette(), supported_locales=["en", "fr"])
+
+        for i in range(50):
+            value = f"fr{i}," + "x" * 10_000
+            scope = {
+                "type": "http",
+                "query_string": b"",
+                "headers": [(b"accept-language", value.encode())],
+            }
+            assert middleware._detect_locale(Request(scope)) == "en"
+        assert middleware._resolve_header.cache_info().currsize == 0
+
+        parse_bytes = middleware._parse_accept_language_bytes
+        assert parse_bytes(b"fr;q=0.5, en-US, de;q=0.8") == ["en-US", "de", "fr"]
+        assert middleware._resolve_accept_language("zz, en;q=0.1".encode("latin-1")) == "en"
+        assert middleware._resolve_accept_language("\xe9s, en".encode("latin-1")) == "en"
+
+    def test_locale_quality_parameters(self):
+        middleware = LocaleMiddleware(Starlette())
+        parse = middleware._parse_accept_language
+
+        # Only a parameter named q sets the quality; freq= is not a q value
+        assert parse("de;freq=1;q=0.2, fr;q=0.5") == ["fr", "de"]
+        assert parse("de;q=0.2;level=1, fr;q=0.5") == ["fr", "de"]
+        assert parse("de ;level=1 ; q=0.1, fr;q=0.4") == ["fr", "de"]
+        # Long but valid qvalues are parsed rather than treated as 1.0
+        assert parse("de;q=0.10000, fr;q=0.9") == ["fr", "de"]
+        # Malformed values default to 1.0, as before
+        assert parse("de;q=0.1, fr;q=high") == ["fr", "de"]
+        assert middleware._parse_accept_language_bytes(b"de;freq=1;q=0.2, fr;q=0.5") == [
+            "fr",
+            "de",
+        ]
+
+    def test_locale_best_match(self):
+        middleware = LocaleMiddleware(Starlette(), supported_locales=["en-US", "es", "pt-BR"])
+        assert middleware._find_best_match(["EN_us"]) == "en-US"
+        assert middleware._find_best_match(["es-MX"]) == "es"
+        assert middleware._find_best_match(["en-GB", "pt-PT"]) == "en"
+        assert middleware._find_best_match(["pt-br"]) == "pt-BR"
+
+        strict = LocaleMiddleware(
+            Starlette(),
+            config=LocaleConfig(supported_locales=["es"], fallback_chain=False),
+        )
+        assert strict._find_best_match(["es-MX"]) == "en"
 
+    def test_locale_keeps_app_headers(self):
         async def homepage(request):
-            return PlainTextResponse("OK")
+            response = PlainTextResponse("OK", headers={"Content-Language": "de"})
+            response.set_cookie("locale", "de")
+            return response
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(LocaleMiddleware, supported_locales=["en", "es"])
-        client = TestClient(app)
+        client = build(LocaleMiddleware, handler=homepage, supported_locales=["en", "de"])
 
-        response = client.get("/")
-        assert response.status_code == 200
+        response = client.send(_GET_ROOT)
+        assert response.headers.get_list("Content-Language") == ["de"]
+        assert response.headers.get_list("Set-Cookie") == ["locale=de; Path=/; SameSite=lax"]
+
+    def test_locale_from_accept_language(self):
+        async def homepage(request):
+            return PlainTextResponse(request.state.locale)
+
+        client = build(
+            LocaleMiddleware,
+            handler=homepage,
+            config=LocaleConfig(supported_locales=["en", "es", "fr-CA"], set_cookie=False),
+        )
+
+        header = {"Accept-Language": "de;q=0.9, es-MX;q=0.8, fr_ca"}
+        for _ in range(2):
+            response = client.get("/", headers=header)
+            assert response.content == b"fr-CA"
+            assert response.headers["Content-Language"] == "fr-CA"
+
+        assert client.get("/", headers={"Accept-Language": "de"}).content == b"en"
+        assert client.get("/?lang=ES", headers=header).content == b"es"
 
 
 # ============== Method Override ==============
 class TestMethodOverride:
     def test_method_override(self):
-        from fastmiddleware import MethodOverrideMiddleware
-
         async def delete_handler(request):
             return PlainTextResponse(f"Method: {request.method}")
 
-        app = Starlette(routes=[Route("/", delete_handler, methods=["DELETE", "POST"])])
-        app.add_middleware(MethodOverrideMiddleware)
-        client = TestClient(app)
+        client = build(MethodOverrideMiddleware, handler=delete_handler, methods=["DELETE", "POST"])
 
         response = client.post("/", headers={"X-HTTP-Method-Override": "DELETE"})
         assert response.status_code == 200
@@ -726,30 +1435,54 @@ class TestMethodOverride:
 # ============== No Cache ==============
 class TestNoCache:
     def test_no_cache(self):
-        from fastmiddleware import NoCacheMiddleware
+        client = build(NoCacheMiddleware, paths={"/", "/api"})
+
+        response = client.send(_GET_ROOT)
+        assert response.status_code == 200
+
+    def test_no_cache_path_prefixes(self):
+        client = build(
+            NoCacheMiddleware,
+            app_routes=[
+                Route("/api/user", ok_endpoint, methods=["GET", "POST"]),
+                Route("/static", ok_endpoint),
+            ],
+            paths={"/api", "/session"},
+        )
+
+        assert "no-store" in client.get("/api/user").headers["Cache-Control"]
+        assert "Cache-Control" not in client.post("/api/user").headers
+        assert "Cache-Control" not in client.get("/static").headers
 
+    def test_no_cache_replaces_existing_headers(self):
         async def homepage(request):
-            return PlainTextResponse("OK")
+            return PlainTextResponse("OK", headers={"Cache-Control": "max-age=60", "X-Other": "1"})
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(NoCacheMiddleware, paths={"/", "/api"})
-        client = TestClient(app)
+        client = build(NoCacheMiddleware, handler=homepage)
 
-        response = client.get("/")
-        assert response.status_code == 200
+        response = client.send(_GET_ROOT)
+        assert response.headers.get_list("Cache-Control") == [
+            "no-store, no-cache, must-revalidate, private"
+        ]
+        assert response.headers["Pragma"] == "no-cache"
+        assert response.headers["Expires"] == "0"
+        assert response.headers["X-Other"] == "1"
+
+    def test_no_cache_keeps_upstream_no_store(self):
+        async def homepage(request):
+            return PlainTextResponse("OK", headers={"Cache-Control": "no-store"})
+
+        client = build(NoCacheMiddleware, handler=homepage)
+
+        response = client.send(_GET_ROOT)
+        assert response.headers["Cache-Control"] == "no-store"
+        assert "Pragma" not in response.headers
 
 
 # ============== Origin ==============
 class TestOrigin:
     def test_origin(self):
-        from fastmiddleware import OriginMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(OriginMiddleware, allowed_origins={"http://localhost"})
-        client = TestClient(app)
+        client = build(OriginMiddleware, allowed_origins={"http://localhost"})
 
         response = client.get("/", headers={"Origin": "http://localhost"})
         assert response.status_code == 200
@@ -758,14 +1491,14 @@ class TestOrigin:
 # ============== Path Rewrite ==============
 class TestPathRewrite:
     def test_path_rewrite(self):
-        from fastmiddleware import PathRewriteMiddleware, RewriteRule
-
         async def homepage(request):
             return PlainTextResponse(f"Path: {request.url.path}")
 
-        app = Starlette(routes=[Route("/api/v1/test", homepage), Route("/old/test", homepage)])
-        app.add_middleware(PathRewriteMiddleware, rules=[RewriteRule("/old", "/api/v1")])
-        client = TestClient(app)
+        client = build(
+            PathRewriteMiddleware,
+            app_routes=[Route("/api/v1/test", homepage), Route("/old/test", homepage)],
+            rules=[RewriteRule("/old", "/api/v1")],
+        )
 
         response = client.get("/old/test")
         assert response.status_code == 200
@@ -774,14 +1507,7 @@ class TestPathRewrite:
 # ============== Payload Size ==============
 class TestPayloadSize:
     def test_payload_size(self):
-        from fastmiddleware import PayloadSizeMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage, methods=["POST"])])
-        app.add_middleware(PayloadSizeMiddleware, max_request_size=1024 * 1024)
-        client = TestClient(app)
+        client = build(PayloadSizeMiddleware, methods=["POST"], max_request_size=1024 * 1024)
 
         response = client.post("/", content="test data")
         assert response.status_code == 200
@@ -790,76 +1516,106 @@ class TestPayloadSize:
 # ============== Permissions Policy ==============
 class TestPermissionsPolicy:
     def test_permissions_policy(self):
-        from fastmiddleware import PermissionsPolicyMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(PermissionsPolicyMiddleware, policies={"camera": []})
-        client = TestClient(app)
+        client = build(PermissionsPolicyMiddleware, policies={"camera": []})
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Profiling ==============
 class TestProfiling:
     def test_profiling(self):
-        from fastmiddleware import ProfilingMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ProfilingMiddleware, enabled=True)
-        client = TestClient(app)
+        client = build(ProfilingMiddleware, enabled=True)
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Quota ==============
 class TestQuota:
     def test_quota(self):
-        from fastmiddleware import QuotaMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
+        client = build(QuotaMiddleware, default_quota=1000)
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(QuotaMiddleware, default_quota=1000)
-        client = TestClient(app)
-
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Real IP ==============
 class TestRealIP:
     def test_real_ip(self):
-        from fastmiddleware import RealIPMiddleware
+        client = build(RealIPMiddleware)
 
+        response = client.get("/", headers={"X-Real-IP": "1.2.3.4"})
+        assert response.status_code == 200
+
+    def test_real_ip_skips_invalid_values(self):
         async def homepage(request):
-            return PlainTextResponse("OK")
+            return PlainTextResponse(request.state.real_ip)
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(RealIPMiddleware)
-        client = TestClient(app)
+        client = build(RealIPMiddleware, handler=homepage)
 
-        response = client.get("/", headers={"X-Real-IP": "1.2.3.4"})
-        assert response.status_code == 200
+        headers = {"X-Real-IP": "not-an-ip", "X-Forwarded-For": "junk, 203.0.113.7, 10.0.0.1"}
+        assert client.get("/", headers=headers).content == b"203.0.113.7"
 
+    @staticmethod
+    def _real_ip(middleware, peer, xff):
+        scope = {
+            "type": "http",
+            "headers": [(b"x-forwarded-for", xff.encode())],
+            "client": (peer, 1234),
+        }
+        return middleware._get_real_ip(Request(scope))
 
-# ============== Redirect ==============
-class TestRedirect:
-    def test_redirect(self):
-        from fastmiddleware import RedirectMiddleware, RedirectRule
+    def test_real_ip_peels_trusted_proxies(self):
+        middleware = RealIPMiddleware(
+            Starlette(),
+            config=RealIPConfig(headers=["X-Forwarded-For"], trusted_proxies={"10.0.0.1", "::1"}),
+        )
+
+        xff = "1.1.1.1, 203.0.113.7, 0:0::1, 10.0.0.1"
+        assert self._real_ip(middleware, "10.0.0.1", xff) == "203.0.113.7"
+        assert self._real_ip(middleware, "::1", "10.0.0.1") == "::1"
+
+    def test_real_ip_peels_trusted_cidr_ranges(self):
+        middleware = RealIPMiddleware(
+            Starlette(),
+            config=RealIPConfig(
+                headers=["X-Forwarded-For"], trusted_proxies={"10.0.0.0/8", "2001:db8::/32"}
+            ),
+        )
+
+        xff = "1.1.1.1, 203.0.113.7, 2001:db8::5, 10.1.2.3, 10.0.0.1"
+        assert self._real_ip(middleware, "10.9.9.9", xff) == "203.0.113.7"
+        # 11.0.0.1 is just outside the /8, so it is the client
+        assert self._real_ip(middleware, "2001:db8::1", "11.0.0.1, 10.0.0.1") == "11.0.0.1"
 
+    async def test_real_ip_ignores_headers_from_untrusted_peer(self):
         async def homepage(request):
-            return PlainTextResponse("OK")
+            return PlainTextResponse(request.state.real_ip)
+
+        app = make_app(
+            RealIPMiddleware, homepage, config=RealIPConfig(trusted_proxies={"10.0.0.0/8"})
+        )
+
+        # A client connecting directly cannot pick its own address
+        transport = httpx.ASGITransport(app=app, client=("198.51.100.9", 1234))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get(
+                "/", headers={"X-Forwarded-For": "1.2.3.4", "X-Real-IP": "5.6.7.8"}
+            )
+        assert response.text == "198.51.100.9"
+
+        # The same headers through a trusted proxy are honoured
+        transport = httpx.ASGITransport(app=app, client=("10.0.0.1", 1234))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/", headers={"X-Forwarded-For": "1.2.3.4"})
+        assert response.text == "1.2.3.4"
 
-        app = Starlette(routes=[Route("/new", homepage)])
+
+# ============== Redirect ==============
+class TestRedirect:
+    def test_redirect(self):
+        app = Starlette(routes=[Route("/new", ok_endpoint)])
         app.add_middleware(RedirectMiddleware, rules=[RedirectRule("/old", "/new")])
         client = TestClient(app, follow_redirects=False)
 
@@ -870,16 +1626,9 @@ class TestRedirect:
 # ============== Referrer Policy ==============
 class TestReferrerPolicy:
     def test_referrer_policy(self):
-        from fastmiddleware import ReferrerPolicyMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ReferrerPolicyMiddleware, policy="strict-origin")
-        client = TestClient(app)
+        client = build(ReferrerPolicyMiddleware, policy="strict-origin")
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
         assert "Referrer-Policy" in response.headers
 
@@ -887,191 +1636,154 @@ class TestReferrerPolicy:
 # ============== Replay Prevention ==============
 class TestReplayPrevention:
     def test_replay_prevention(self):
-        from fastmiddleware import ReplayPreventionMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ReplayPreventionMiddleware)
-        client = TestClient(app)
+        client = build(ReplayPreventionMiddleware, methods=["POST"])
 
         timestamp = str(int(time.time()))
-        nonce = "unique-nonce-123"
-        client.get("/", headers={"X-Timestamp": timestamp, "X-Nonce": nonce})
-        # May fail without both headers, which is expected behavior
+        headers = {"X-Timestamp": timestamp, "X-Nonce": "unique-nonce-123"}
+        assert client.post("/", headers=headers).status_code == 200
+        assert client.post("/", headers=headers).status_code == 400
+        assert client.post("/").status_code == 400
 
 
 # ============== Request Coalescing ==============
 class TestRequestCoalescing:
     def test_request_coalescing(self):
-        from fastmiddleware import RequestCoalescingMiddleware
+        client = build(RequestCoalescingMiddleware)
 
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(RequestCoalescingMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Request Dedup ==============
 class TestRequestDedup:
     def test_request_dedup(self):
-        from fastmiddleware import RequestDedupMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
+        client = build(RequestDedupMiddleware)
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(RequestDedupMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Request Fingerprint ==============
 class TestRequestFingerprint:
     def test_request_fingerprint(self):
-        from fastmiddleware import RequestFingerprintMiddleware
+        client = build(RequestFingerprintMiddleware)
 
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(RequestFingerprintMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
+        assert response.headers["X-Fingerprint"]
 
 
 # ============== Request ID Propagation ==============
 class TestRequestIDPropagation:
     def test_request_id_propagation(self):
-        from fastmiddleware import RequestIDPropagationMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(RequestIDPropagationMiddleware)
-        client = TestClient(app)
+        client = build(RequestIDPropagationMiddleware)
 
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
+        generated = response.headers["X-Request-ID"]
+        assert len(generated) == 32
+        int(generated, 16)
 
-
-# ============== Request Limit ==============
-class TestRequestLimit:
-    def test_request_limit(self):
-        from fastmiddleware import RequestLimitMiddleware
-
+    def test_request_id_propagation_limits_chain(self):
         async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage, methods=["POST"])])
-        app.add_middleware(RequestLimitMiddleware, max_size=1024 * 1024)
-        client = TestClient(app)
-
-        response = client.post("/", content="test")
-        assert response.status_code == 200
-
-
-# ============== Request Logger ==============
-class TestRequestLogger:
-    def test_request_logger(self):
-        from fastmiddleware import RequestLoggerMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(RequestLoggerMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/")
-        assert response.status_code == 200
-
-
-# ============== Request Priority ==============
-class TestRequestPriority:
-    def test_request_priority(self):
-        from fastmiddleware import RequestPriorityMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(RequestPriorityMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/")
-        assert response.status_code == 200
+            return PlainTextResponse(",".join(request.state.request_ids))
 
+        client = build(
+            RequestIDPropagationMiddleware,
+            handler=homepage,
+            config=RequestIDPropagationConfig(max_chain=3),
+        )
 
-# ============== Request Sampler ==============
-class TestRequestSampler:
-    def test_request_sampler(self):
-        from fastmiddleware import RequestSamplerMiddleware
+        response = client.get("/", headers={"X-Request-ID": "a, b, a, c, d", "X-Trace-ID": "b"})
+        chain = response.text.split(",")
+        assert chain[:2] == ["b", "c"]
+        assert len(chain) == 3
+        assert response.headers["X-Request-ID"] == chain[-1]
 
+    def test_request_id_propagation_ignores_overlong_header(self):
         async def homepage(request):
-            return PlainTextResponse("OK")
+            return PlainTextResponse(",".join(request.state.request_ids))
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(RequestSamplerMiddleware, rate=0.5)
-        client = TestClient(app)
+        client = build(
+            RequestIDPropagationMiddleware,
+            handler=homepage,
+            config=RequestIDPropagationConfig(max_header_bytes=16),
+        )
 
-        response = client.get("/")
+        response = client.get(
+            "/", headers={"X-Request-ID": ",".join(["a"] * 20), "X-Trace-ID": "t"}
+        )
+        chain = response.text.split(",")
+        assert chain[0] == "t"
+        assert len(chain) == 2
+
+
+# ============== Smoke ==============
+# Middlewares whose basic test is a single request expecting a 200
+_SMOKE_CASES = [
+    (RequestLimitMiddleware, {"max_size": 1024 * 1024}, "POST", "/", None),
+    (RequestLoggerMiddleware, {}, "GET", "/", None),
+    (RequestPriorityMiddleware, {}, "GET", "/", None),
+    (RequestSamplerMiddleware, {"rate": 0.5}, "GET", "/", None),
+    (RequestValidatorMiddleware, {"rules": []}, "GET", "/", None),
+    (ResponseSignatureMiddleware, {"secret_key": "test-secret"}, "GET", "/", None),
+    (ResponseTimeMiddleware, {}, "GET", "/", None),
+    (RetryAfterMiddleware, {}, "GET", "/", None),
+    (RouteAuthMiddleware, {"routes": []}, "GET", "/public", None),
+    (SanitizationMiddleware, {}, "GET", "/", None),
+    (ScopeMiddleware, {"route_scopes": {}}, "GET", "/", None),
+    (ServerTimingMiddleware, {}, "GET", "/", None),
+    (SessionMiddleware, {"config": SessionConfig(max_age=3600)}, "GET", "/", None),
+    (SlowResponseMiddleware, {"enabled": False}, "GET", "/", None),
+    (TenantMiddleware, {}, "GET", "/", _HDR_TENANT),
+    (TimeoutMiddleware, {"timeout": 30.0}, "GET", "/", None),
+    (UserAgentMiddleware, {}, "GET", "/", _HDR_UA),
+    (VersioningMiddleware, {}, "GET", "/", _HDR_VERSION),
+    (XFFTrustMiddleware, {"trusted_proxies": _TRUSTED}, "GET", "/", _HDR_XFF),
+]
+
+
+class TestMiddlewareSmoke:
+    @pytest.mark.smoke
+    @pytest.mark.parametrize(
+        ("mw_cls", "kwargs", "method", "path", "headers"),
+        _SMOKE_CASES,
+        ids=[case[0].__name__ for case in _SMOKE_CASES],
+    )
+    async def test_middleware_smoke(self, mw_cls, kwargs, method, path, headers):
+        app = make_app(mw_cls, path=path, methods=[method], **kwargs)
+
+        response = await asgi_request(app, method, path, headers=headers)
         assert response.status_code == 200
 
 
 # ============== Request Signing ==============
 class TestRequestSigning:
     def test_request_signing(self):
-        from fastmiddleware import RequestSigningMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        secret = "test-secret"
-        timestamp = str(int(time.time()))
-        message = f"{timestamp}.GET./.".encode()
-        hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(RequestSigningMiddleware, secret_key=secret, exclude_paths={"/health"})
-        client = TestClient(app)
-
-        # Test excluded path
-        client.get("/health")
-
-
-# ============== Request Validator ==============
-class TestRequestValidator:
-    def test_request_validator(self):
-        from fastmiddleware import RequestValidatorMiddleware
+        client = build(
+            RequestSigningMiddleware,
+            path="/health",
+            secret_key="test-secret",
+            exclude_paths=_EXCLUDE,
+        )
 
-        async def homepage(request):
-            return PlainTextResponse("OK")
+        # Excluded paths pass through unsigned
+        assert client.get("/health").status_code == 200
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(RequestValidatorMiddleware, rules=[])
-        client = TestClient(app)
+    def test_request_signing_verifies_signature(self):
+        client = build(RequestSigningMiddleware, secret_key="test-secret")
 
-        response = client.get("/")
-        assert response.status_code == 200
+        timestamp = str(int(time.time()))
+        signature = hmac.digest(b"test-secret", f"{timestamp}.GET./.".encode(), "sha256").hex()
+        headers = {"X-Timestamp": timestamp, "X-Signature": signature}
+        assert client.get("/", headers=headers).status_code == 200
+        assert client.get("/", headers={**headers, "X-Signature": "0" * 64}).status_code == 401
+        assert client.send(_GET_ROOT).status_code == 401
 
 
 # ============== Response Cache ==============
 class TestResponseCache:
     def test_response_cache(self):
-        from fastmiddleware import ResponseCacheMiddleware
-
         call_count = 0
 
         async def homepage(request):
@@ -1079,216 +1791,112 @@ class TestResponseCache:
             call_count += 1
             return PlainTextResponse(f"Count: {call_count}")
 
-        app = Starlette(routes=[Route("/", homepage)])
-        ResponseCacheMiddleware(app, default_ttl=60)
-        client = TestClient(app)
+        client = build(ResponseCacheMiddleware, handler=homepage, default_ttl=60)
 
-        response = client.get("/")
-        assert response.status_code == 200
+        first = client.get("/")
+        second = client.get("/")
+        assert first.status_code == second.status_code == 200
+        assert second.content == first.content == b"Count: 1"
+        assert second.headers["X-Cache"] == "HIT"
+        assert call_count == 1
 
 
 # ============== Response Format ==============
 class TestResponseFormat:
     def test_response_format(self):
-        from fastmiddleware import ResponseFormatMiddleware
-
-        async def homepage(request):
-            return JSONResponse({"data": "test"})
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ResponseFormatMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/")
-        assert response.status_code == 200
-
+        client = build(ResponseFormatMiddleware, handler=_json_data)
 
-# ============== Response Signature ==============
-class TestResponseSignature:
-    def test_response_signature(self):
-        from fastmiddleware import ResponseSignatureMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ResponseSignatureMiddleware, secret_key="test-secret")
-        client = TestClient(app)
-
-        response = client.get("/")
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200
 
 
 # ============== Response Time ==============
 class TestResponseTime:
-    def test_response_time(self):
-        from fastmiddleware import ResponseTimeMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ResponseTimeMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/")
-        assert response.status_code == 200
-
-
-# ============== Retry After ==============
-class TestRetryAfter:
-    def test_retry_after(self):
-        from fastmiddleware import RetryAfterMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(RetryAfterMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/")
-        assert response.status_code == 200
-
-
-# ============== Route Auth ==============
-class TestRouteAuth:
-    def test_route_auth(self):
-        from fastmiddleware import RouteAuthMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/public", homepage)])
-        app.add_middleware(RouteAuthMiddleware, routes=[])
-        client = TestClient(app)
-
-        response = client.get("/public")
-        assert response.status_code == 200
-
-
-# ============== Sanitization ==============
-class TestSanitization:
-    def test_sanitization(self):
-        from fastmiddleware import SanitizationMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(SanitizationMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/")
-        assert response.status_code == 200
-
-
-# ============== Scope ==============
-class TestScope:
-    def test_scope(self):
-        from fastmiddleware import ScopeMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ScopeMiddleware, route_scopes={})
-        client = TestClient(app)
+    def test_response_time_stats(self):
+        middleware = ResponseTimeMiddleware(Starlette())
+        for duration in (30.0, 10.0, 20.0):
+            middleware._update_stats("/a", duration)
+        middleware._update_stats("/b", 5.0)
+
+        stats = middleware.get_stats()
+        assert stats["/a"] == {
+            "count": 3,
+            "total_ms": 60.0,
+            "max_ms": 30.0,
+            "min_ms": 10.0,
+            "warnings": 0,
+            "critical": 0,
+            "avg_ms": 20.0,
+        }
+        assert stats["/b"]["count"] == 1
+
+    def test_response_time_logs_slow_requests(self, caplog):
+        middleware = ResponseTimeMiddleware(
+            Starlette(routes=_OK_ROUTES),
+            config=ResponseTimeConfig(default_warning_ms=0.0, default_critical_ms=1e9),
+        )
+        client = TestClient(middleware)
+
+        with caplog.at_level("WARNING", logger="response_time"):
+            client.get("/")
+
+        assert "WARNING: GET / took" in caplog.text
+        assert middleware.get_stats()["/"]["warnings"] == 1
+
+    def test_response_time_sla_lookup(self):
+        middleware = ResponseTimeMiddleware(
+            Starlette(),
+            config=ResponseTimeConfig(
+                slas=[
+                    ResponseTimeSLA("/api/health", target_ms=5, warning_ms=10, critical_ms=20),
+                    ResponseTimeSLA("/api", target_ms=50, warning_ms=100, critical_ms=200),
+                ]
+            ),
+        )
 
-        response = client.get("/")
-        assert response.status_code == 200
+        assert middleware._get_sla("/api/health/db") == (5, 10, 20)
+        assert middleware._get_sla("/api/users") == (50, 100, 200)
+        assert middleware._get_sla("/other") == (100.0, 500.0, 1000.0)
 
 
 # ============== Server Timing ==============
 class TestServerTiming:
-    def test_server_timing(self):
-        from fastmiddleware import ServerTimingMiddleware
-
-        async def homepage(request):
+    def test_server_timing_dispatch(self):
+        async def timed(request):
+            add_timing("db", 2.0)
             return PlainTextResponse("OK")
 
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(ServerTimingMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/")
-        assert response.status_code == 200
-
-
-# ============== Session ==============
-class TestSession:
-    def test_session(self):
-        from fastmiddleware import SessionConfig, SessionMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        config = SessionConfig(max_age=3600)
-        app.add_middleware(SessionMiddleware, config=config)
-        client = TestClient(app)
-
-        response = client.get("/")
-        assert response.status_code == 200
-
-
-# ============== Slow Response ==============
-class TestSlowResponse:
-    def test_slow_response_disabled(self):
-        from fastmiddleware import SlowResponseMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(SlowResponseMiddleware, enabled=False)
-        client = TestClient(app)
-
-        response = client.get("/")
-        assert response.status_code == 200
-
-
-# ============== Tenant ==============
-class TestTenant:
-    def test_tenant(self):
-        from fastmiddleware import TenantMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(TenantMiddleware)
-        client = TestClient(app)
+        routes = [Route("/", ok_endpoint), Route("/timed", timed)]
+        client = build(ServerTimingMiddleware, app_routes=routes)
+        assert client.get("/").headers["Server-Timing"].startswith("total;dur=")
+        assert client.get("/timed").headers["Server-Timing"].startswith("db;dur=2.00, total;dur=")
 
-        response = client.get("/", headers={"X-Tenant-ID": "test-tenant"})
-        assert response.status_code == 200
-
-
-# ============== Timeout ==============
-class TestTimeout:
-    def test_timeout(self):
-        from fastmiddleware import TimeoutMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(TimeoutMiddleware, timeout=30.0)
-        client = TestClient(app)
+        client = build(
+            ServerTimingMiddleware,
+            app_routes=routes,
+            config=ServerTimingConfig(include_total=False),
+        )
+        assert "Server-Timing" not in client.get("/").headers
+        assert client.get("/timed").headers["Server-Timing"] == "db;dur=2.00"
+
+    def test_server_timing_header_format(self):
+        middleware = ServerTimingMiddleware(Starlette())
+        timings = [{"name": "db", "dur": 1.234, "desc": "Query"}, {"name": "cache"}]
+        assert middleware._build_header(timings, 5.0) == (
+            'db;dur=1.23;desc="Query", cache, total;dur=5.00'
+        )
+        assert middleware._build_header([], 5.0) == "total;dur=5.00"
 
-        response = client.get("/")
-        assert response.status_code == 200
+        no_total = ServerTimingMiddleware(
+            Starlette(), config=ServerTimingConfig(include_total=False)
+        )
+        assert no_total._build_header([], 5.0) == ""
 
 
 # ============== Trailing Slash ==============
 class TestTrailingSlash:
     def test_trailing_slash(self):
-        from fastmiddleware import TrailingSlashMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/test", homepage)])
+        app = Starlette(routes=[Route("/test", ok_endpoint)])
         app.add_middleware(TrailingSlashMiddleware)
         client = TestClient(app, follow_redirects=True)
 
@@ -1296,84 +1904,31 @@ class TestTrailingSlash:
         assert response.status_code == 200
 
 
-# ============== User Agent ==============
-class TestUserAgent:
-    def test_user_agent(self):
-        from fastmiddleware import UserAgentMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(UserAgentMiddleware)
-        client = TestClient(app)
-
-        response = client.get(
-            "/", headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
-        )
-        assert response.status_code == 200
-
-
-# ============== Versioning ==============
-class TestVersioning:
-    def test_versioning(self):
-        from fastmiddleware import VersioningMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(VersioningMiddleware)
-        client = TestClient(app)
-
-        response = client.get("/", headers={"X-API-Version": "2.0"})
-        assert response.status_code == 200
-
-
 # ============== Warmup ==============
 class TestWarmup:
     def test_warmup(self):
-        from fastmiddleware import WarmupMiddleware
+        middleware = make_app(WarmupMiddleware)
+        client = TestClient(middleware)
 
-        async def homepage(request):
-            return PlainTextResponse("OK")
+        response = client.send(_GET_ROOT)
+        assert response.status_code == 200
 
-        app = Starlette(routes=[Route("/", homepage)])
-        WarmupMiddleware(app)
-        client = TestClient(app)
+        warmup = client.get("/_warmup")
+        assert warmup.status_code == 200
+        assert warmup.json()["ready"] is True
 
-        response = client.get("/")
-        assert response.status_code == 200
+        middleware.set_ready(False)
+        response = client.send(_GET_ROOT)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+        assert client.get("/", headers={"X-Warmup": "true"}).status_code == 503
 
 
 # ============== Webhook ==============
 class TestWebhook:
     def test_webhook(self):
-        from fastmiddleware import WebhookMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(WebhookMiddleware, secret="test-secret", paths={"/webhook"})
-        client = TestClient(app)
+        client = build(WebhookMiddleware, secret="test-secret", paths=_WEBHOOK_PATHS)
 
         # Regular path should work
-        response = client.get("/")
-        assert response.status_code == 200
-
-
-# ============== XFF Trust ==============
-class TestXFFTrust:
-    def test_xff_trust(self):
-        from fastmiddleware import XFFTrustMiddleware
-
-        async def homepage(request):
-            return PlainTextResponse("OK")
-
-        app = Starlette(routes=[Route("/", homepage)])
-        app.add_middleware(XFFTrustMiddleware, trusted_proxies={"10.0.0.0/8"})
-        client = TestClient(app)
-
-        response = client.get("/", headers={"X-Forwarded-For": "1.2.3.4"})
+        response = client.send(_GET_ROOT)
         assert response.status_code == 200